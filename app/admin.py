@@ -0,0 +1,86 @@
+"""维护命令
+
+用法:
+    python admin.py rebuild-stats            # 重建所有用户的汇总表
+    python admin.py rebuild-stats jerry mxy  # 只重建指定用户
+    python admin.py rebuild-streaks          # 只重建连续打卡天数
+    python admin.py seed --users 1000 --days 1825  # 生成测试数据
+    python admin.py migrate                  # 只建表和执行迁移（多节点部署时可以在更新应用之前单独运行）
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import select
+
+from models import User
+from database import engine, SessionLocal
+from migrations import LATEST_VERSION, init_db
+from stats import rebuild_all_user_stats, rebuild_streaks
+from seed import seed
+
+def select_users(usernames):
+    query = select(User)
+    if usernames:
+        query = query.where(User.username.in_(usernames))
+    return query
+
+async def rebuild_stats(usernames):
+    async with SessionLocal() as db:
+        count = await rebuild_all_user_stats(db, (await db.scalars(select_users(usernames))).all())
+        await db.commit()
+    print(f'已重建 {count} 个用户的统计数据')
+
+async def rebuild_user_streaks(usernames):
+    async with SessionLocal() as db:
+        count = await rebuild_streaks(db, (await db.scalars(select_users(usernames))).all())
+        await db.commit()
+    print(f'已重建 {count} 个用户的连续打卡天数')
+
+async def seed_data(args):
+    start = time.perf_counter()
+
+    def progress(users, records, food_records):
+        print(f'\r{users}/{args.users} 个用户，{records} 条打卡记录，{food_records} 条饮食记录，'
+              f'{time.perf_counter() - start:.0f} 秒', end='', flush=True)
+
+    async with SessionLocal() as db:
+        await seed(db, args.users, args.days, args.prefix, args.seed, progress=progress)
+    print()
+
+async def run(args):
+    applied = await init_db(engine)
+    try:
+        if args.command == 'migrate':
+            print(f'执行了迁移 {applied}，当前版本 {LATEST_VERSION}' if applied else f'已是最新版本 {LATEST_VERSION}')
+        elif args.command == 'rebuild-stats':
+            await rebuild_stats(args.usernames)
+        elif args.command == 'rebuild-streaks':
+            await rebuild_user_streaks(args.usernames)
+        elif args.command == 'seed':
+            await seed_data(args)
+    finally:
+        await engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description='饮食记录维护命令')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('migrate', help='建表并执行未执行的迁移')
+
+    rebuild = subparsers.add_parser('rebuild-stats', help='从原始记录重建 user_stats 和 user_rollups 汇总表')
+    rebuild.add_argument('usernames', nargs='*', help='只重建指定用户（默认全部）')
+
+    streaks = subparsers.add_parser('rebuild-streaks', help='从打卡记录重建 user_stats 中的连续打卡天数')
+    streaks.add_argument('usernames', nargs='*', help='只重建指定用户（默认全部）')
+
+    fake = subparsers.add_parser('seed', help='生成测试用户及其打卡和饮食记录（截止到昨天）')
+    fake.add_argument('--users', type=int, default=1000, help='用户数')
+    fake.add_argument('--days', type=int, default=365, help='每个用户的天数')
+    fake.add_argument('--prefix', default='seed', help='用户名前缀，用户名为前缀加序号')
+    fake.add_argument('--seed', type=int, default=0, help='随机种子，相同的种子生成相同的数据')
+
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == '__main__':
+    main()
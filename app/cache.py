@@ -0,0 +1,93 @@
+"""进程内缓存
+
+page_cache 按 (路由, 用户名, 日期) 缓存渲染好的 HTML。日期是键的一部分，过了零点旧条目自然失效；
+用户提交记录或修改设置后按用户名精确清除。
+user_cache 按 ('user', 用户名) 缓存用户信息，修改设置或注册时清除。
+admin.py 等其他进程的写入无法通知到这里，由 TTL 兜底；多 worker 部署时打开 CACHE_VERIFY_VERSION，
+由 users.lookup_user 按 user_stats.version 发现其他进程的写入（gunicorn.conf.py 会自动打开；
+使用 PostgreSQL 时其他节点也可能写入，默认打开）。
+"""
+import os
+import time
+from collections import OrderedDict
+
+from database import IS_SQLITE
+
+PAGE_CACHE_SIZE = int(os.getenv('PAGE_CACHE_SIZE', '1024'))
+PAGE_CACHE_TTL = float(os.getenv('PAGE_CACHE_TTL', '300'))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '4096'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '300'))
+VERIFY_VERSION = os.getenv('CACHE_VERIFY_VERSION', '0' if IS_SQLITE else '1') == '1'
+
+class LRUCache:
+    # 键是元组，第二项为用户名，可以按用户名整体清除
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (过期时间, 值)
+        self._keys_by_user = {}
+        self._generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def generation(self, username):
+        # 渲染前取一次，写入缓存时比较：渲染期间用户有新的写入就不缓存旧结果
+        return self._generations.get(username, 0)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, generation):
+        username = key[1]
+        if self.maxsize <= 0 or generation != self.generation(username):
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        self._keys_by_user.setdefault(username, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, username):
+        self._generations[username] = self.generation(username) + 1
+        for key in self._keys_by_user.pop(username, ()):
+            self._entries.pop(key, None)
+        self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_user.clear()
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._keys_by_user.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[1]]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
+
+page_cache = LRUCache(PAGE_CACHE_SIZE, PAGE_CACHE_TTL)
+user_cache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
@@ -0,0 +1,190 @@
+"""实时推送（Server-Sent Events）
+
+打开的用户主页通过 GET /u/{username}/events 订阅该用户的更新，submit_record / submit_detail / submit_setting
+提交后把一条小的 JSON 推给所有订阅者，页面就地更新，不需要轮询或刷新整页：
+    event: record    data: {"date", "choice", ...}             打卡
+    event: food      data: {"date", "breakfast", ..., ...}     记录饮食
+    event: setting   data: {...}                               修改个人设置
+    event: stats     data: {...}                               其他进程的写入（见下）
+每条都带有 stats（与主页“统计概览”相同的数值）、bmr、checked_in_today 和 version（user_stats.version）。
+
+订阅在进程内：每个连接一个有界队列，消息只编码一次再放入各个队列，慢的客户端只会丢掉较旧的消息
+（每条消息都带有完整的统计数值，丢掉中间的不影响结果）。空闲连接只占一个队列和一个等待中的协程，
+不占数据库连接，单个 worker 可以同时保持数千个连接。
+多 worker 部署时订阅者和写入可能不在同一个进程，每个 worker 每隔 EVENTS_POLL_INTERVAL 秒用一次查询
+检查本进程订阅的用户的 version，有变化的再推送一条 stats（gunicorn 多 worker 时默认 2 秒，单进程时不检查）。
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import threading
+from datetime import date
+
+from sqlalchemy import select
+
+from cache import VERIFY_VERSION
+from models import User, UserStats
+from stats import overview_stats
+
+EVENTS_KEEPALIVE = float(os.getenv('EVENTS_KEEPALIVE', '15'))
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', '16'))
+EVENTS_POLL_INTERVAL = float(os.getenv('EVENTS_POLL_INTERVAL', '2' if VERIFY_VERSION else '0'))
+POLL_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(",", ":"))}\n\n'
+
+def user_payload(user_stats, bmr, **data):
+    data.update(
+        bmr=bmr,
+        stats=overview_stats(user_stats, bmr),
+        checked_in_today=user_stats.streak_last_date == date.today(),
+        version=user_stats.version
+    )
+    return data
+
+class Broker:
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self._subscribers = {}  # 用户名 -> 队列集合
+        self._versions = {}  # 用户名 -> 最近推送的 version，轮询时据此判断是否有新的写入
+        self.closed = False
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, username):
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers.setdefault(username, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, username, queue):
+        queues = self._subscribers.get(username)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[username]
+                self._versions.pop(username, None)
+
+    def has_subscribers(self, username):
+        return username in self._subscribers
+
+    def usernames(self):
+        return list(self._subscribers)
+
+    def _put(self, queue, message):
+        if queue.full():
+            queue.get_nowait()
+            self.dropped += 1
+        queue.put_nowait(message)
+
+    def publish(self, username, event, data):
+        queues = self._subscribers.get(username)
+        if not queues:
+            return
+        if 'version' in data:
+            self._versions[username] = max(self._versions.get(username, 0), data['version'])
+        message = format_event(event, data)
+        for queue in queues:
+            self._put(queue, message)
+        self.published += 1
+
+    def known_version(self, username):
+        return self._versions.get(username)
+
+    def close(self):
+        # 通知所有连接结束（None），之后的新连接直接结束
+        self.closed = True
+        for queues in self._subscribers.values():
+            for queue in queues:
+                self._put(queue, None)
+
+    def stats(self):
+        return {
+            'connections': sum(len(queues) for queues in self._subscribers.values()),
+            'users': len(self._subscribers),
+            'published': self.published,
+            'dropped': self.dropped
+        }
+
+broker = Broker(EVENTS_QUEUE_SIZE)
+
+async def event_stream(username):
+    # 客户端断开时 StreamingResponse 会取消这个生成器，finally 中取消订阅
+    if broker.closed:
+        return
+    queue = broker.subscribe(username)
+    try:
+        # 断线后浏览器 3 秒后自动重连
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                # 注释行，防止代理因为长时间没有数据断开连接
+                yield ': keepalive\n\n'
+                continue
+            if message is None:
+                return
+            yield message
+    finally:
+        broker.unsubscribe(username, queue)
+
+async def publish_update(db, user, event, **data):
+    # 提交之后调用；本进程没有人订阅这个用户时不查询
+    if not broker.has_subscribers(user.username):
+        return
+    user_stats = await db.get(UserStats, user.id, populate_existing=True)
+    if user_stats is not None:
+        broker.publish(user.username, event, user_payload(user_stats, user.bmr, **data))
+
+async def poll_versions(session_factory, interval=EVENTS_POLL_INTERVAL):
+    # 多 worker 时发现其他进程的写入：只查询本进程有订阅者的用户，version 变化的再读取汇总行
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await _poll_once(session_factory)
+        except Exception:
+            logger.exception('检查订阅用户的数据版本失败')
+
+async def _poll_once(session_factory):
+    usernames = broker.usernames()
+    for i in range(0, len(usernames), POLL_BATCH_SIZE):
+        batch = usernames[i:i + POLL_BATCH_SIZE]
+        async with session_factory() as db:
+            versions = (await db.execute(
+                select(User.username, UserStats.version)
+                .join(UserStats, UserStats.user_id == User.id)
+                .where(User.username.in_(batch))
+            )).all()
+            changed = [username for username, version in versions
+                       if broker.known_version(username) is None or version > broker.known_version(username)]
+            if not changed:
+                continue
+            rows = (await db.execute(
+                select(User.username, User.bmr, UserStats)
+                .join(UserStats, UserStats.user_id == User.id)
+                .where(User.username.in_(changed))
+            )).all()
+        # 刚订阅的用户也推送一次，页面加载之后、订阅之前其他进程的写入不会漏掉
+        for username, bmr, user_stats in rows:
+            broker.publish(username, 'stats', user_payload(user_stats, bmr))
+
+def close_on_exit():
+    """uvicorn 收到 SIGTERM / SIGINT 后要等所有请求结束才执行 lifespan 的关闭，而 SSE 连接不会自己结束。
+    在 uvicorn 的信号处理函数外再包一层，收到信号时先让所有事件流结束。需要在 lifespan 启动时调用。"""
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(signum)
+
+        def handler(signum, frame, previous=previous):
+            loop.call_soon_threadsafe(broker.close)
+            if callable(previous):
+                previous(signum, frame)
+
+        signal.signal(signum, handler)
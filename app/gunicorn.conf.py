@@ -0,0 +1,58 @@
+"""生产环境启动配置
+
+    gunicorn -c gunicorn.conf.py main:app
+
+master 进程只负责在启动 worker 之前建表、迁移和补齐汇总表（只执行一次），之后 fork 出 WEB_CONCURRENCY 个
+uvicorn worker，每个 worker 使用自己的数据库连接池，不与 master 或其他 worker 共享连接。
+各 worker 的页面和用户缓存互相独立，多 worker 时打开 CACHE_VERIFY_VERSION，按 user_stats.version 发现其他 worker 的写入；
+/metrics 的数据通过 METRICS_DIR 在 worker 之间汇总。
+使用 PostgreSQL（DATABASE_URL）时可以在多台机器上各自运行一组 worker，迁移由 PostgreSQL 的咨询锁保证只执行一次。
+开发时仍然可以用 uvicorn main:app --reload 单进程运行。
+"""
+import asyncio
+import glob
+import multiprocessing
+import os
+import tempfile
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 8)))
+worker_class = 'uvicorn.workers.UvicornWorker'
+timeout = int(os.getenv('WORKER_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+# 不预加载应用：每个 worker 自己导入 main，在 fork 之后才创建事件循环和连接
+preload_app = False
+accesslog = os.getenv('ACCESS_LOG') or None
+
+if workers > 1:
+    os.environ.setdefault('CACHE_VERIFY_VERSION', '1')
+    os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp(prefix='diet-metrics-'))
+
+def on_starting(server):
+    # 清除上一次运行留下的指标，计数从零开始
+    metrics_dir = os.getenv('METRICS_DIR')
+    if metrics_dir:
+        for path in glob.glob(os.path.join(metrics_dir, '*.json')):
+            os.remove(path)
+
+    from database import engine, SessionLocal
+    from migrations import init_db
+    from stats import backfill_user_stats
+
+    async def prepare():
+        await init_db(engine)
+        async with SessionLocal() as db:
+            backfilled = await backfill_user_stats(db)
+        # 关闭 master 中的连接，fork 出的 worker 从空的连接池开始
+        await engine.dispose()
+        return backfilled
+
+    backfilled = asyncio.run(prepare())
+    server.log.info('数据库初始化完成，补齐了 %d 个用户的统计汇总', backfilled)
+    os.environ['DB_INIT_DONE'] = '1'
+
+def post_fork(server, worker):
+    # 保险起见丢弃从 master 继承的连接池（不关闭连接，它们属于 master）
+    from database import engine
+    engine.sync_engine.dispose(close=False)
@@ -0,0 +1,95 @@
+"""后台任务队列
+
+提交记录后不影响响应内容的派生数据（目前是周、月汇总）放到进程内的 asyncio 队列，在响应发送之后更新：
+    - 由 JOB_CONCURRENCY 个 worker 协程执行（默认 2），在 lifespan 中启动和停止
+    - 同一个键的任务在开始执行前只保留一个，例如同一用户当天连续提交多次，汇总只重算一次
+    - 任务需要是幂等的（按原始记录重新计算），开始执行后再提交同一个键会重新排队，保证读到最新的数据
+    - 关闭时等待队列中的任务执行完，最多 JOB_DRAIN_TIMEOUT 秒
+进程异常退出时还没执行的任务会丢失，之后同一周期的提交或 admin.py rebuild-stats 会重新计算。
+队列没有启动（JOB_CONCURRENCY=0，或 admin.py 等没有运行 lifespan 的脚本）时任务在提交时直接执行。
+"""
+import asyncio
+import logging
+import os
+
+JOB_CONCURRENCY = int(os.getenv('JOB_CONCURRENCY', '2'))
+JOB_DRAIN_TIMEOUT = float(os.getenv('JOB_DRAIN_TIMEOUT', '10'))
+
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self._queue = None
+        self._pending = {}  # 键 -> (函数, 参数)，只包含还没开始执行的任务
+        self._workers = []
+        self.running = 0
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        # 需要在事件循环中调用（lifespan 启动时）
+        if self.concurrency <= 0 or self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def submit(self, key, func, *args):
+        self.submitted += 1
+        if not self._workers:
+            return await self._run(key, func, args)
+        if key in self._pending:
+            # 同一个键已经在排队，用最新的参数替换，不再重复排队
+            self.coalesced += 1
+            self._pending[key] = (func, args)
+            return
+        self._pending[key] = (func, args)
+        self._queue.put_nowait(key)
+
+    async def _work(self):
+        while True:
+            key = await self._queue.get()
+            func, args = self._pending.pop(key)
+            try:
+                await self._run(key, func, args)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, key, func, args):
+        self.running += 1
+        try:
+            await func(*args)
+            self.completed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception('后台任务 %r 执行失败', key)
+        finally:
+            self.running -= 1
+
+    async def stop(self, timeout=JOB_DRAIN_TIMEOUT):
+        # 先等队列清空，超时后放弃剩下的任务
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning('关闭时仍有 %d 个后台任务没有执行', len(self._pending))
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self):
+        return {
+            'depth': len(self._pending),
+            'running': self.running,
+            'concurrency': self.concurrency,
+            'submitted': self.submitted,
+            'coalesced': self.coalesced,
+            'completed': self.completed,
+            'failed': self.failed
+        }
+
+job_queue = JobQueue(JOB_CONCURRENCY)
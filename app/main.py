@@ -1,58 +1,126 @@
-from fastapi import FastAPI, Request, Depends, HTTPException
+from fastapi import FastAPI, Request, Depends, HTTPException, Query, File, UploadFile
+from fastapi.responses import Response, JSONResponse, HTMLResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import create_engine, Column, Integer, String, Date, Float
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import select, and_
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import date, timedelta
+from typing import Literal, Optional
+from urllib.parse import quote
+import asyncio
+import csv
+import hashlib
 import os
-
-Base = declarative_base()
-
-class User(Base):
-    __tablename__ = 'users'
-    id = Column(Integer, primary_key=True)
-    username = Column(String(50), unique=True)
-    weight = Column(Integer)
-    height = Column(Integer)
-    age = Column(Integer)
-    gender = Column(String(10))
-    bmr = Column(Float)
-
-class FoodRecord(Base):
-    __tablename__ = 'food_records'
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer)
-    record_date = Column(Date)
-    breakfast = Column(Integer)
-    lunch = Column(Integer)
-    dinner = Column(Integer)
-    snack = Column(Integer)
-    total_calories = Column(Integer)
-
-class Record(Base):
-    __tablename__ = 'records'
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer)
-    record_date = Column(Date)
-    choice = Column(String(20))
-
-engine = create_engine('sqlite:///./data/data.db')
-Base.metadata.create_all(bind=engine)
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-app = FastAPI()
+from contextlib import asynccontextmanager
+
+from models import User, FoodRecord, Record
+from database import engine, SessionLocal, get_db, insert
+from migrations import init_db
+from stats import overview_stats, get_user_stats, get_streaks, get_user_version, backfill_user_stats, ensure_user_stats, apply_record, apply_food_record, refresh_qualified_deficit, rebuild_user_stats
+from series import build_chart_series
+from rollups import load_trends, refresh_rollups
+from jobs import job_queue
+from events import EVENTS_POLL_INTERVAL, broker, event_stream, publish_update, poll_versions, close_on_exit
+from cache import page_cache, user_cache
+from users import UserInfo, calculate_bmr, lookup_user, find_user, get_user, load_usernames, remember_username, username_exists
+from ratelimit import RateLimiter
+from transfer import BATCH_SIZE, validate_entries, iter_entries, write_entries, export_chunks
+import metrics
+import profiling
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # gunicorn 部署时由 master 进程在启动 worker 之前完成建表和迁移（见 gunicorn.conf.py）
+    if os.getenv('DB_INIT_DONE') != '1':
+        await init_db(engine)
+        async with SessionLocal() as db:
+            await backfill_user_stats(db)
+    precompile_templates()
+    async with SessionLocal() as db:
+        await load_usernames(db)
+    flusher = asyncio.create_task(flush_metrics()) if metrics.ENABLED and metrics.METRICS_DIR else None
+    job_queue.start()
+    close_on_exit()
+    poller = asyncio.create_task(poll_versions(SessionLocal)) if EVENTS_POLL_INTERVAL > 0 else None
+    yield
+    broker.close()
+    if poller:
+        poller.cancel()
+    # 先执行完排队的后台任务，再写出最后的指标、关闭连接
+    await job_queue.stop()
+    if flusher:
+        flusher.cancel()
+        metrics.write_snapshot()
+    await engine.dispose()
+
+async def flush_metrics():
+    # 多 worker 时定期把本进程的指标写到 METRICS_DIR，由处理 /metrics 的 worker 汇总
+    while True:
+        metrics.write_snapshot()
+        await asyncio.sleep(metrics.FLUSH_INTERVAL)
+
+async def refresh_rollups_job(user_id, day):
+    # 后台任务，在响应发送之后重算当天所在的周、月汇总
+    async with SessionLocal() as db:
+        await refresh_rollups(db, user_id, day)
+        await db.commit()
+
+async def schedule_rollups(user, day):
+    # 同一用户同一天排队中的任务只保留一个
+    await job_queue.submit(('rollups', user.id, day), refresh_rollups_job, user.id, day)
+
+app = FastAPI(lifespan=lifespan)
 import os
 app.mount("/static", StaticFiles(directory=os.path.join(os.path.dirname(__file__), "static")), name="static")
 templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "templates"))
+# 编译结果缓存在临时目录（按模板内容校验），重启后直接加载字节码
+templates.env.bytecode_cache = FileSystemBytecodeCache()
+if metrics.ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engine(engine)
+    metrics.instrument_templates(templates.env)
+if profiling.PROFILE_DIR:
+    app.add_middleware(profiling.ProfilingMiddleware, invalidate=page_cache.invalidate)
+    profiling.instrument_engine(engine)
+STREAM_CHUNK_SIZE = 8192
+
+def precompile_templates():
+    # 启动时加载全部模板，第一个请求不需要再编译
+    for name in templates.env.list_templates(extensions=['html']):
+        templates.env.get_template(name)
+
+def page_key(route, username):
+    # 页面内容与“今天”有关，日期作为键的一部分，零点后自动换新
+    return (route, username, date.today())
+
+def render_cached(key, generation, name, context):
+    response = templates.TemplateResponse(name, context)
+    page_cache.set(key, response.body, generation)
+    return response
+
+def stream_cached(key, generation, name, context):
+    # 边渲染边发送：</head> 之前的部分先发出去，浏览器可以提前加载样式，之后每攒够 STREAM_CHUNK_SIZE 发送一次。
+    # 渲染完成后把完整页面写入 page_cache
+    template = templates.get_template(name)
+
+    async def chunks():
+        parts, pending, size, head_sent = [], [], 0, False
+        for text in template.generate(context):
+            pending.append(text)
+            size += len(text)
+            if size >= STREAM_CHUNK_SIZE or (not head_sent and '</head>' in text):
+                head_sent = head_sent or '</head>' in text
+                chunk = ''.join(pending).encode()
+                parts.append(chunk)
+                pending, size = [], 0
+                yield chunk
+        chunk = ''.join(pending).encode()
+        parts.append(chunk)
+        yield chunk
+        page_cache.set(key, b''.join(parts), generation)
+
+    return StreamingResponse(chunks(), media_type='text/html; charset=utf-8')
 
 @app.get('/')
 async def root(request: Request):
@@ -63,22 +131,23 @@ async def register_page(request: Request):
     return templates.TemplateResponse('register.html', {'request': request})
 
 @app.post('/register')
-async def register_user(request: Request, db: Session = Depends(get_db)):
+async def register_user(request: Request, db: AsyncSession = Depends(get_db)):
     data = await request.form()
     username = data.get('username')
     
-    # 检查用户名是否已存在
-    existing_user = db.query(User).filter(User.username == username).first()
-    if existing_user:
+    # 依靠 username 唯一约束判断用户名是否已存在，并发注册同一个用户名也只有一个能成功
+    result = await db.execute(
+        insert(User).values(username=username).on_conflict_do_nothing(index_elements=['username'])
+    )
+    if result.rowcount == 0:
+        await db.rollback()
         return templates.TemplateResponse('register.html', {
             'request': request,
             'error': '用户名已被注册，请更换一个'
         })
-    
-    # 创建新用户
-    new_user = User(username=username)
-    db.add(new_user)
-    db.commit()
+    await db.commit()
+    user_cache.invalidate(username)
+    remember_username(username)
     
     return templates.TemplateResponse('register.html', {
         'request': request,
@@ -86,127 +155,71 @@ async def register_user(request: Request, db: Session = Depends(get_db)):
         'username': username
     })
 
+# 注册页面输入时实时检查用户名，按客户端限流
+check_user_limiter = RateLimiter(
+    rate=float(os.getenv('CHECK_USER_RATE', '5')),
+    burst=int(os.getenv('CHECK_USER_BURST', '10'))
+)
+
 @app.get('/check_user')
-async def check_user(username: str, db: Session = Depends(get_db)):
-    # 检查用户是否存在
-    user = db.query(User).filter(User.username == username).first()
-    return {'exists': user is not None}
+async def check_user(request: Request, username: str, db: AsyncSession = Depends(get_db)):
+    if not check_user_limiter.allow(request.client.host if request.client else ''):
+        raise HTTPException(status_code=429, detail="请求过于频繁，请稍后再试", headers={'Retry-After': '1'})
+    # 查内存中的用户名集合，单进程部署时不访问数据库
+    return {'exists': await username_exists(db, username)}
 
 @app.get('/u/{username}')
-async def user_page(request: Request, username: str, db: Session = Depends(get_db)):
-    # 获取或创建用户
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        user = User(username=username)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-
-    # 检查用户是否填写了个人信息
-    if not all([user.weight, user.height, user.age, user.gender]):
+async def user_page(request: Request, username: str, user: Optional[UserInfo] = Depends(find_user), db: AsyncSession = Depends(get_db)):
+    key = page_key('user_page', username)
+    cached = page_cache.get(key)
+    if cached is not None:
+        return HTMLResponse(cached)
+    generation = page_cache.generation(username)
+
+    # 新用户或没有填写个人信息时，重定向到设置页面（保存设置时才会创建用户）
+    if not user or not all([user.weight, user.height, user.age, user.gender]):
         # 如果没有填写，重定向到设置页面
         from fastapi.responses import RedirectResponse
         return RedirectResponse(url=f'/u/{username}/setting?new_user=true')
 
     # 检查今日记录
     today = date.today()
-    existing_record = db.query(Record).filter(
+    existing_record = await db.scalar(select(Record).where(
         Record.user_id == user.id,
         Record.record_date == today
-    ).first()
-
-    # 获取历史记录
-    records = db.query(Record).filter(
-        Record.user_id == user.id
-    ).order_by(Record.record_date.desc()).all()
-
-    # 计算统计数据
-    total_records = db.query(Record).filter(Record.user_id == user.id).count()
-    eat_much_count = db.query(Record).filter(
-        Record.user_id == user.id,
-        Record.choice == 'eat_much'
-    ).count()
-    not_eat_much_count = total_records - eat_much_count
+    ))
 
-    # 计算连续打卡天数（无论吃多还是没吃多）
-    consecutive_days = 0
-    if records:
-        sorted_records = sorted(records, key=lambda x: x.record_date, reverse=True)
-        prev_date = sorted_records[0].record_date
-        consecutive_days = 1
-        for record in sorted_records[1:]:
-            if (prev_date - record.record_date).days == 1:
-                consecutive_days += 1
-                prev_date = record.record_date
-            else:
-                break
+    # 统计数据从汇总表读取，数值与 /u/{username}/events 推送的一致
+    user_stats = await get_user_stats(db, user)
 
     # 获取今日饮食记录
     today = date.today()
-    today_food_record = db.query(FoodRecord).filter(
+    today_food_record = await db.scalar(select(FoodRecord).where(
         FoodRecord.user_id == user.id,
         FoodRecord.record_date == today
-    ).first()
-
-    # 计算各餐平均摄入量
-    food_records = db.query(FoodRecord).filter(FoodRecord.user_id == user.id).all()
-    breakfast_total = sum(fr.breakfast for fr in food_records if fr.breakfast > 0)
-    lunch_total = sum(fr.lunch for fr in food_records if fr.lunch > 0)
-    dinner_total = sum(fr.dinner for fr in food_records if fr.dinner > 0)
-    snack_total = sum(fr.snack for fr in food_records if fr.snack > 0)
-    
-    breakfast_days = sum(1 for fr in food_records if fr.breakfast > 0)
-    lunch_days = sum(1 for fr in food_records if fr.lunch > 0)
-    dinner_days = sum(1 for fr in food_records if fr.dinner > 0)
-    snack_days = sum(1 for fr in food_records if fr.snack > 0)
-
-    avg_breakfast_calories = round(breakfast_total / breakfast_days, 1) if breakfast_days else 0
-    avg_lunch_calories = round(lunch_total / lunch_days, 1) if lunch_days else 0
-    avg_dinner_calories = round(dinner_total / dinner_days, 1) if dinner_days else 0
-    avg_snack_calories = round(snack_total / snack_days, 1) if snack_days else 0
-
-    # 计算平均每日摄入热量和热量缺口
-    total_calories = sum(fr.total_calories for fr in food_records if fr.total_calories)
-    food_days = len([fr for fr in food_records if fr.total_calories])
-    avg_daily_calories = round(total_calories / food_days, 1) if food_days > 0 else 0
-
-    return templates.TemplateResponse('user.html', {
+    ))
+
+    return render_cached(key, generation, 'user.html', {
         'request': request,
         'user': user,
         'existing_record': existing_record,
-        'records': records,
         'today_food_record': today_food_record,
-        'stats': {
-            'total_days': total_records,
-            'eat_much_count': eat_much_count,
-            'eat_much_percent': round(eat_much_count / total_records * 100, 1) if total_records > 0 else 0,
-            'not_eat_much_count': not_eat_much_count,
-            'not_eat_much_percent': round(not_eat_much_count / total_records * 100, 1) if total_records > 0 else 0,
-            'consecutive_days': consecutive_days,
-            'avg_calorie_deficit': round(user.bmr - avg_daily_calories, 1) if user.bmr and avg_daily_calories else 0,
-            'avg_breakfast_calories': avg_breakfast_calories,
-            'avg_lunch_calories': avg_lunch_calories,
-            'avg_dinner_calories': avg_dinner_calories,
-            'avg_snack_calories': avg_snack_calories
-        }
+        'stats': overview_stats(user_stats, user.bmr)
     })
 
 @app.get('/u/{username}/setting')
-async def user_setting(request: Request, username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        user = User(username=username)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    return templates.TemplateResponse('setting.html', {'request': request, 'user': user})
+async def user_setting(request: Request, username: str, user: Optional[UserInfo] = Depends(find_user)):
+    # 新用户只显示空白表单，不写数据库
+    return templates.TemplateResponse('setting.html', {'request': request, 'user': user or User(username=username)})
 
 @app.post('/u/{username}/setting')
-async def submit_setting(request: Request, username: str, db: Session = Depends(get_db)):
+async def submit_setting(request: Request, username: str, db: AsyncSession = Depends(get_db)):
     data = await request.form()
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
+    # 第一次保存设置时创建用户
+    created = (await db.execute(
+        insert(User).values(username=username).on_conflict_do_nothing(index_elements=['username'])
+    )).rowcount == 1
+    user = await db.scalar(select(User).where(User.username == username))
 
     user.weight = int(data.get('weight', 0))
     user.height = int(data.get('height', 0))
@@ -214,179 +227,132 @@ async def submit_setting(request: Request, username: str, db: Session = Depends(
     user.gender = data.get('gender', 'male')
 
     # 计算BMR
-    if user.gender == 'male':
-        user.bmr = 13.397 * user.weight + 4.799 * user.height - 5.677 * user.age + 88.362
-    else:
-        user.bmr = 9.247 * user.weight + 3.098 * user.height - 4.330 * user.age + 447.593
-
-    db.commit()
+    user.bmr = calculate_bmr(user.gender, user.weight, user.height, user.age)
+
+    await refresh_qualified_deficit(db, user)
+    await db.commit()
+    user_cache.invalidate(user.username)
+    page_cache.invalidate(user.username)
+    remember_username(user.username)
+    await publish_update(db, user, 'setting')
+
+    # 页面用 fetch 提交时只返回结果；新用户跳转到主页，已有用户打开着的主页会通过事件流更新
+    if 'application/json' in request.headers.get('accept', ''):
+        return {'status': 'success', 'bmr': user.bmr, 'created': created}
     return templates.TemplateResponse('setting.html', {
         'request': request, 
         'user': user, 
         'message': '设置已保存，您的基础代谢率为: {:.2f} kcal/天。<br>系统将在3秒后自动重定向到主页。'.format(user.bmr)
     })
 
-@app.get('/u/{username}/charts')
-async def charts_page(request: Request, username: str, db: Session = Depends(get_db)):
-    # 获取用户
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        user = User(username=username)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
+CHART_WINDOWS = (7, 30, 90, 365)
+TREND_WINDOWS = (90, 365, 1825)
 
-    # 获取最近30天的数据
+async def build_chart_data(db: AsyncSession, user, days=30):
+    # 获取最近 days 天的数据，只取图表需要的列
     today = date.today()
-    thirty_days_ago = today - timedelta(days=30)
+    start_date = today - timedelta(days=days)
 
-    # 获取食物记录
-    food_records = db.query(FoodRecord).filter(
+    food_rows = (await db.execute(select(
+        FoodRecord.record_date, FoodRecord.breakfast, FoodRecord.lunch,
+        FoodRecord.dinner, FoodRecord.snack, FoodRecord.total_calories
+    ).where(
         FoodRecord.user_id == user.id,
-        FoodRecord.record_date >= thirty_days_ago
-    ).order_by(FoodRecord.record_date).all()
+        FoodRecord.record_date >= start_date
+    ).order_by(FoodRecord.record_date))).all()
 
-    # 获取饮食选择记录
-    record_choices = db.query(Record).filter(
+    record_rows = (await db.execute(select(Record.record_date, Record.choice).where(
         Record.user_id == user.id,
-        Record.record_date >= thirty_days_ago
-    ).order_by(Record.record_date).all()
-
-    # 准备图表数据
-    dates = []
-    calories = []
-    calorie_deficit = []
-    eat_much = []
-    not_eat_much = []
-    streaks = []
-
-    # 初始化日期范围
-    current_date = thirty_days_ago
-    date_to_calories = {}
-    date_to_choice = {}
-
-    # 填充食物记录数据
-    for record in food_records:
-        date_str = record.record_date.strftime('%Y-%m-%d')
-        date_to_calories[date_str] = record.total_calories
-        if user.bmr:
-            date_to_calories[f'{date_str}_deficit'] = user.bmr - record.total_calories
-
-    # 填充饮食选择数据
-    for record in record_choices:
-        date_str = record.record_date.strftime('%Y-%m-%d')
-        date_to_choice[date_str] = record.choice
-
-    # 计算连续打卡天数
-    consecutive_days = 0
-    prev_date = None
-
-    # 生成日期序列和对应数据
-    while current_date <= today:
-        date_str = current_date.strftime('%Y-%m-%d')
-        dates.append(date_str)
-
-        # 热量数据
-        calories.append(date_to_calories.get(date_str, 0))
-
-        # 热量缺口数据
-        deficit = date_to_calories.get(f'{date_str}_deficit', 0) if user.bmr else 0
-        calorie_deficit.append(deficit)
-
-        # 饮食选择数据
-        eat_much.append(1 if date_to_choice.get(date_str) == 'eat_much' else 0)
-        not_eat_much.append(1 if date_to_choice.get(date_str) == 'not_eat_much' else 0)
-
-        # 连续打卡天数
-        if date_str in date_to_choice:
-            if prev_date and (current_date - prev_date).days == 1:
-                consecutive_days += 1
-            else:
-                consecutive_days = 1
-            prev_date = current_date
-        else:
-            consecutive_days = 0
-        streaks.append(consecutive_days)
-
-        current_date += timedelta(days=1)
-
-    # 各餐热量占比
-    breakfast_total = sum(fr.breakfast for fr in food_records if fr.breakfast)
-    lunch_total = sum(fr.lunch for fr in food_records if fr.lunch)
-    dinner_total = sum(fr.dinner for fr in food_records if fr.dinner)
-    snack_total = sum(fr.snack for fr in food_records if fr.snack)
-    total = breakfast_total + lunch_total + dinner_total + snack_total
-
-    meals = {
-        'breakfast': breakfast_total,
-        'lunch': lunch_total,
-        'dinner': dinner_total,
-        'snack': snack_total
-    }
+        Record.record_date >= start_date
+    ).order_by(Record.record_date))).all()
 
-    # 饮食规律热力图数据 (按星期)
-    weekday_patterns = {
-        'breakfast': [0, 0, 0, 0, 0, 0, 0],  # 周日到周六
-        'lunch': [0, 0, 0, 0, 0, 0, 0],
-        'dinner': [0, 0, 0, 0, 0, 0, 0],
-        'snack': [0, 0, 0, 0, 0, 0, 0],
-        'count': [0, 0, 0, 0, 0, 0, 0]
-    }
+    return build_chart_series(start_date, today, user.bmr, food_rows, record_rows)
 
-    for record in food_records:
-        weekday = record.record_date.weekday()  # 0=周一, 6=周日
-        # 转换为周日=0, 周六=6
-        adjusted_weekday = (weekday + 1) % 7
-        weekday_patterns['count'][adjusted_weekday] += 1
-        weekday_patterns['breakfast'][adjusted_weekday] += record.breakfast or 0
-        weekday_patterns['lunch'][adjusted_weekday] += record.lunch or 0
-        weekday_patterns['dinner'][adjusted_weekday] += record.dinner or 0
-        weekday_patterns['snack'][adjusted_weekday] += record.snack or 0
-
-    # 计算平均值
-    eating_patterns = {
-        'breakfast': [],
-        'lunch': [],
-        'dinner': [],
-        'snack': []
-    }
+def chart_etag(user, version, days):
+    # 数据版本 + 日期 + 时间范围：有新的写入、跨天或换了范围时 ETag 才会变化
+    key = f'{user.id}:{version}:{date.today().isoformat()}:{days}'
+    return '"{}"'.format(hashlib.sha1(key.encode()).hexdigest())
 
-    for i in range(7):
-        count = weekday_patterns['count'][i] or 1
-        eating_patterns['breakfast'].append(round(weekday_patterns['breakfast'][i] / count, 1))
-        eating_patterns['lunch'].append(round(weekday_patterns['lunch'][i] / count, 1))
-        eating_patterns['dinner'].append(round(weekday_patterns['dinner'][i] / count, 1))
-        eating_patterns['snack'].append(round(weekday_patterns['snack'][i] / count, 1))
-
-    # 饮食习惯数据
-    eating_habits = {
-        'eat_much': eat_much,
-        'not_eat_much': not_eat_much
-    }
+def etag_matches(request: Request, etag):
+    return etag in [tag.strip().removeprefix('W/') for tag in request.headers.get('if-none-match', '').split(',')]
 
-    return templates.TemplateResponse('charts.html', {
+@app.get('/u/{username}/charts')
+async def charts_page(request: Request, username: str, user: UserInfo = Depends(get_user)):
+    key = page_key('charts', username)
+    cached = page_cache.get(key)
+    if cached is not None:
+        return HTMLResponse(cached)
+    generation = page_cache.generation(username)
+
+    # 图表数据由页面通过 /api/u/{username}/charts 获取
+    return stream_cached(key, generation, 'charts.html', {
         'request': request,
         'user': user,
-        'dates': dates,
-        'calories': calories,
-        'meals': meals,
-        'eating_habits': eating_habits,
-        'calorie_deficit': calorie_deficit,
-        'eating_patterns': eating_patterns,
-        'streaks': streaks
+        'chart_windows': CHART_WINDOWS,
+        'trend_windows': TREND_WINDOWS
     })
 
-@app.get('/u/{username}/detail')
-async def food_detail(request: Request, username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
+@app.get('/api/u/{username}/charts')
+async def charts_api(request: Request, days: int = 30, user: UserInfo = Depends(get_user), db: AsyncSession = Depends(get_db)):
+    if days not in CHART_WINDOWS:
+        raise HTTPException(status_code=422, detail=f"days 只能是 {', '.join(map(str, CHART_WINDOWS))}")
+
+    # 数据没有变化时直接返回 304，不再查询和计算
+    etag = chart_etag(user, await get_user_version(db, user), days)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    return JSONResponse(await build_chart_data(db, user, days), headers=headers)
+
+@app.get('/api/u/{username}/trends')
+async def trends_api(
+    request: Request,
+    period: Literal['week', 'month'] = 'week',
+    days: int = 365,
+    user: UserInfo = Depends(get_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # 按周或按月的趋势，读取 user_rollups 中的周期行，查询量与天数无关
+    if days not in TREND_WINDOWS:
+        raise HTTPException(status_code=422, detail=f"days 只能是 {', '.join(map(str, TREND_WINDOWS))}")
+
+    etag = chart_etag(user, await get_user_version(db, user), f'{period}:{days}')
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    today = date.today()
+    return JSONResponse(await load_trends(db, user, period, today - timedelta(days=days), today), headers=headers)
+
+@app.get('/u/{username}/events')
+async def user_events(username: str):
+    # 用户主页订阅更新（Server-Sent Events）。不使用 get_db 依赖：较新的 FastAPI 在流式响应结束后才清理 yield 依赖，
+    # 空闲的连接会一直占着连接池中的数据库连接；这里查到用户后立即关闭会话，推送期间不占数据库连接
+    async with SessionLocal() as db:
+        user = await lookup_user(db, username)
+    if user is None:
         raise HTTPException(status_code=404, detail="用户不存在")
+    return StreamingResponse(event_stream(user.username), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
+@app.get('/metrics')
+async def metrics_page():
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.get('/api/cache/stats')
+async def cache_stats():
+    return {'pages': page_cache.stats(), 'users': user_cache.stats()}
+
+@app.get('/u/{username}/detail')
+async def food_detail(request: Request, user: UserInfo = Depends(get_user), db: AsyncSession = Depends(get_db)):
     today = date.today()
-    existing_record = db.query(FoodRecord).filter(
+    existing_record = await db.scalar(select(FoodRecord).where(
         FoodRecord.user_id == user.id,
         FoodRecord.record_date == today
-    ).first()
+    ))
 
     return templates.TemplateResponse('detail.html', {
         'request': request, 
@@ -394,158 +360,123 @@ async def food_detail(request: Request, username: str, db: Session = Depends(get
         'existing_record': existing_record
     })
 
+HISTORY_PAGE_SIZE = 30
+
+async def load_history_page(db: AsyncSession, user, cursor=None, limit=HISTORY_PAGE_SIZE, order='newest', choice=None):
+    # 按 record_date 做游标分页：每页一次 records LEFT JOIN food_records，走 (user_id, record_date) 索引
+    query = select(
+        Record.record_date,
+        Record.choice,
+        FoodRecord.breakfast,
+        FoodRecord.lunch,
+        FoodRecord.dinner,
+        FoodRecord.snack,
+        FoodRecord.total_calories
+    ).select_from(Record).outerjoin(FoodRecord, and_(
+        FoodRecord.user_id == Record.user_id,
+        FoodRecord.record_date == Record.record_date
+    )).where(Record.user_id == user.id)
+
+    if choice:
+        query = query.where(Record.choice == choice)
+    if order == 'oldest':
+        if cursor:
+            query = query.where(Record.record_date > cursor)
+        query = query.order_by(Record.record_date)
+    else:
+        if cursor:
+            query = query.where(Record.record_date < cursor)
+        query = query.order_by(Record.record_date.desc())
+
+    # 多取一条用来判断是否还有下一页
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    records = []
+    for row in rows[:limit]:
+        # 计算热量缺口（BMR - 总卡路里）
+        has_food = row.total_calories is not None
+        records.append({
+            'record_date': row.record_date.isoformat(),
+            'choice': row.choice,
+            'breakfast_calories': row.breakfast if has_food else 0,
+            'lunch_calories': row.lunch if has_food else 0,
+            'dinner_calories': row.dinner if has_food else 0,
+            'snack_calories': row.snack if has_food else 0,
+            'total_calories': row.total_calories if has_food else 0,
+            'calorie_deficit': user.bmr - row.total_calories if has_food and user.bmr else 0
+        })
+    next_cursor = records[-1]['record_date'] if len(rows) > limit else None
+    return records, next_cursor
+
 @app.get('/u/{username}/history')
-async def user_history(request: Request, username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
+async def user_history(request: Request, username: str, user: UserInfo = Depends(get_user), db: AsyncSession = Depends(get_db)):
+    key = page_key('history', username)
+    cached = page_cache.get(key)
+    if cached is not None:
+        return HTMLResponse(cached)
+    generation = page_cache.generation(username)
 
-    # 获取所有历史记录
-    records = db.query(Record).filter(
-        Record.user_id == user.id
-    ).order_by(Record.record_date.desc()).all()
-
-    # 获取所有食物记录并按日期存储
-    food_records = db.query(FoodRecord).filter(
-        FoodRecord.user_id == user.id
-    ).all()
-    food_record_map = {fr.record_date: fr for fr in food_records}
-
-    # 合并记录数据
-    for record in records:
-        food_record = food_record_map.get(record.record_date)
-        if food_record:
-            record.breakfast_calories = food_record.breakfast
-            record.lunch_calories = food_record.lunch
-            record.dinner_calories = food_record.dinner
-            record.snack_calories = food_record.snack
-            record.total_calories = food_record.total_calories
-            # 计算热量缺口（BMR - 总卡路里）
-            if user.bmr:
-                record.calorie_deficit = user.bmr - food_record.total_calories
-            else:
-                record.calorie_deficit = 0
-        else:
-            record.breakfast_calories = 0
-            record.lunch_calories = 0
-            record.dinner_calories = 0
-            record.snack_calories = 0
-            record.total_calories = 0
-            record.calorie_deficit = 0
-
-    return templates.TemplateResponse('history.html', {
+    # 只渲染第一页，后续页面由前端滚动时通过 /api/u/{username}/history 加载
+    records, next_cursor = await load_history_page(db, user)
+
+    return stream_cached(key, generation, 'history.html', {
         'request': request,
         'user': user,
-        'records': records
+        'records': records,
+        'next_cursor': next_cursor
     })
 
-@app.get('/u/{username}/statistics')
-async def user_statistics(request: Request, username: str, db: Session = Depends(get_db)):
-    # 获取用户
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
+@app.get('/api/u/{username}/history')
+async def user_history_api(
+    cursor: Optional[date] = None,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=100),
+    order: Literal['newest', 'oldest'] = 'newest',
+    choice: Optional[Literal['eat_much', 'not_eat_much']] = None,
+    user: UserInfo = Depends(get_user),
+    db: AsyncSession = Depends(get_db)
+):
+    records, next_cursor = await load_history_page(db, user, cursor, limit, order, choice)
+    return {'records': records, 'next_cursor': next_cursor}
 
-    # 获取历史记录
-    records = db.query(Record).filter(
-        Record.user_id == user.id
-    ).order_by(Record.record_date.desc()).all()
-
-    # 获取饮食记录
-    food_records = db.query(FoodRecord).filter(
-        FoodRecord.user_id == user.id
-    ).all()
-
-    # 计算原有统计数据
-    total_records = db.query(Record).filter(Record.user_id == user.id).count()
-    eat_much_count = db.query(Record).filter(
-        Record.user_id == user.id,
-        Record.choice == 'eat_much'
-    ).count()
+@app.get('/u/{username}/statistics')
+async def user_statistics(request: Request, username: str, user: UserInfo = Depends(get_user), db: AsyncSession = Depends(get_db)):
+    key = page_key('statistics', username)
+    cached = page_cache.get(key)
+    if cached is not None:
+        return HTMLResponse(cached)
+    generation = page_cache.generation(username)
+
+    # 统计数据从汇总表读取
+    user_stats = await get_user_stats(db, user)
+    total_records = user_stats.total_days
+    eat_much_count = user_stats.eat_much_count
     not_eat_much_count = total_records - eat_much_count
 
-    # 计算连续天数
-    current_streak = {'eat_much': 0, 'not_eat_much': 0}
-    for record in sorted(records, key=lambda x: x.record_date, reverse=True):
-        if record.choice == 'eat_much':
-            if current_streak['eat_much'] == 0:
-                current_streak['eat_much'] += 1
-            else:
-                break
-        else:
-            if current_streak['not_eat_much'] == 0:
-                current_streak['not_eat_much'] += 1
-            else:
-                break
-
-    # 计算最长连续记录
-    max_streak = {'eat_much': 0, 'not_eat_much': 0}
-    current_eat_much = 0
-    current_not_eat_much = 0
-    for record in sorted(records, key=lambda x: x.record_date):
-        if record.choice == 'eat_much':
-            current_eat_much += 1
-            current_not_eat_much = 0
-            max_streak['eat_much'] = max(max_streak['eat_much'], current_eat_much)
-        else:
-            current_not_eat_much += 1
-            current_eat_much = 0
-            max_streak['not_eat_much'] = max(max_streak['not_eat_much'], current_not_eat_much)
+    # 连续天数从汇总表读取：今天还没打卡时当前连续天数记为 0
+    streaks = get_streaks(user_stats)
+    is_current = streaks['last_date'] == date.today()
 
     # 计算平均每周记录次数
-    if total_records > 0 and records:
-        first_record_date = min(records, key=lambda x: x.record_date).record_date
-        days_since_first_record = (date.today() - first_record_date).days
+    if total_records > 0 and user_stats.first_record_date:
+        days_since_first_record = (date.today() - user_stats.first_record_date).days
         weeks = days_since_first_record / 7
         avg_weekly_records = round(total_records / weeks, 1) if weeks > 0 else total_records
     else:
         avg_weekly_records = 0
 
     # 计算饮食平均摄入量
-    breakfast_total = sum(fr.breakfast for fr in food_records if fr.breakfast > 0)
-    lunch_total = sum(fr.lunch for fr in food_records if fr.lunch > 0)
-    dinner_total = sum(fr.dinner for fr in food_records if fr.dinner > 0)
-    snack_total = sum(fr.snack for fr in food_records if fr.snack > 0)
-    
-    breakfast_days = sum(1 for fr in food_records if fr.breakfast > 0)
-    lunch_days = sum(1 for fr in food_records if fr.lunch > 0)
-    dinner_days = sum(1 for fr in food_records if fr.dinner > 0)
-    snack_days = sum(1 for fr in food_records if fr.snack > 0)
-
-    
-    avg_breakfast_calories = round(breakfast_total / breakfast_days, 1) if breakfast_days else 0
-    avg_lunch_calories = round(lunch_total / lunch_days, 1) if lunch_days else 0
-    avg_dinner_calories = round(dinner_total / dinner_days, 1) if dinner_days else 0
-    avg_snack_calories = round(snack_total / snack_days, 1) if snack_days else 0
-
-    breakfast_total = sum(fr.breakfast for fr in food_records if fr.breakfast > 0)
-    lunch_total = sum(fr.lunch for fr in food_records if fr.lunch > 0)
-    dinner_total = sum(fr.dinner for fr in food_records if fr.dinner > 0)
-    snack_total = sum(fr.snack for fr in food_records if fr.snack > 0)
-    
-    breakfast_days = sum(1 for fr in food_records if fr.breakfast > 0)
-    lunch_days = sum(1 for fr in food_records if fr.lunch > 0)
-    dinner_days = sum(1 for fr in food_records if fr.dinner > 0)
-    snack_days = sum(1 for fr in food_records if fr.snack > 0)
-    
-    avg_breakfast_calories = round(breakfast_total / breakfast_days, 1) if breakfast_days else 0
-    avg_lunch_calories = round(lunch_total / lunch_days, 1) if lunch_days else 0
-    avg_dinner_calories = round(dinner_total / dinner_days, 1) if dinner_days else 0
-    avg_snack_calories = round(snack_total / snack_days, 1) if snack_days else 0
+    avg_breakfast_calories = round(user_stats.breakfast_total / user_stats.breakfast_days, 1) if user_stats.breakfast_days else 0
+    avg_lunch_calories = round(user_stats.lunch_total / user_stats.lunch_days, 1) if user_stats.lunch_days else 0
+    avg_dinner_calories = round(user_stats.dinner_total / user_stats.dinner_days, 1) if user_stats.dinner_days else 0
+    avg_snack_calories = round(user_stats.snack_total / user_stats.snack_days, 1) if user_stats.snack_days else 0
 
     # 计算热量缺口相关指标
-    if user.bmr and food_records:
-        total_deficit = 0
-        qualified_count = 0
-        for fr in food_records:
-            deficit = user.bmr - fr.total_calories
-            total_deficit += deficit
-            if 0 < deficit <= 500:  # 假设合理的热量缺口为0-500大卡
-                qualified_count += 1
-        
-        avg_calorie_deficit = round(total_deficit / len(food_records), 1)
-        calorie_deficit_rate = round(qualified_count / len(food_records) * 100, 2) if food_records else 0
-        
+    food_days = user_stats.food_days
+    if user.bmr and food_days:
+        total_deficit = user.bmr * food_days - user_stats.calories_total
+        avg_calorie_deficit = round(total_deficit / food_days, 1)
+        # 假设合理的热量缺口为0-500大卡
+        calorie_deficit_rate = round(user_stats.qualified_deficit_days / food_days * 100, 2)
+
         # 计算累计消耗脂肪
         total_calorie_deficit = round(total_deficit, 1)
         # 1公斤脂肪约等于7700千卡，1斤(500克)约等于3850千卡
@@ -556,20 +487,7 @@ async def user_statistics(request: Request, username: str, db: Session = Depends
         total_calorie_deficit = 0
         total_fat_lost_kg = 0
 
-    # 计算连续打卡天数
-    current_streak_days = 0
-    if records:
-        sorted_dates = sorted(set(r.record_date for r in records), reverse=True)
-        today = date.today()
-        if sorted_dates[0] == today:
-            current_streak_days += 1
-            for i in range(1, len(sorted_dates)):
-                if (sorted_dates[i-1] - sorted_dates[i]).days == 1:
-                    current_streak_days += 1
-                else:
-                    break
-
-    return templates.TemplateResponse('statistics.html', {
+    return render_cached(key, generation, 'statistics.html', {
         'request': request,
         'user': user,
         'stats': {
@@ -578,10 +496,10 @@ async def user_statistics(request: Request, username: str, db: Session = Depends
             'eat_much_percent': round(eat_much_count/total_records*100, 2) if total_records else 0,
             'not_eat_much_count': not_eat_much_count,
             'not_eat_much_percent': round(not_eat_much_count/total_records*100, 2) if total_records else 0,
-            'current_eat_much_streak': current_streak['eat_much'],
-            'current_not_eat_much_streak': current_streak['not_eat_much'],
-            'max_eat_much_streak': max_streak['eat_much'],
-            'max_not_eat_much_streak': max_streak['not_eat_much'],
+            'current_eat_much_streak': streaks['current_eat_much'] if is_current else 0,
+            'current_not_eat_much_streak': streaks['current_not_eat_much'] if is_current else 0,
+            'max_eat_much_streak': streaks['longest_eat_much'],
+            'max_not_eat_much_streak': streaks['longest_not_eat_much'],
             'avg_weekly_records': avg_weekly_records,
             'avg_breakfast_calories': avg_breakfast_calories,
             'avg_lunch_calories': avg_lunch_calories,
@@ -590,27 +508,14 @@ async def user_statistics(request: Request, username: str, db: Session = Depends
             'avg_calorie_deficit': avg_calorie_deficit,
             'total_calorie_deficit': total_calorie_deficit,
             'total_fat_lost_kg': total_fat_lost_kg,
-            'current_streak': current_streak_days,
+            'current_streak': streaks['current'] if is_current else 0,
             'calorie_deficit_rate': calorie_deficit_rate
         }
     })
 
 @app.post('/u/{username}/detail')
-async def submit_detail(request: Request, username: str, db: Session = Depends(get_db)):
+async def submit_detail(request: Request, user: UserInfo = Depends(get_user), db: AsyncSession = Depends(get_db)):
     data = await request.form()
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
-
-    today = date.today()
-    existing = db.query(FoodRecord).filter(
-        FoodRecord.user_id == user.id,
-        FoodRecord.record_date == today
-    ).first()
-
-    if existing:
-        db.delete(existing)
-        db.commit()
 
     breakfast = int(data.get('breakfast', 0))
     lunch = int(data.get('lunch', 0))
@@ -618,17 +523,32 @@ async def submit_detail(request: Request, username: str, db: Session = Depends(g
     snack = int(data.get('snack', 0))
     total = breakfast + lunch + dinner + snack
 
-    new_record = FoodRecord(
-        user_id=user.id,
-        record_date=today,
-        breakfast=breakfast,
-        lunch=lunch,
-        dinner=dinner,
-        snack=snack,
-        total_calories=total
+    today = date.today()
+    values = {
+        'breakfast': breakfast,
+        'lunch': lunch,
+        'dinner': dinner,
+        'snack': snack,
+        'total_calories': total
+    }
+    new_record = FoodRecord(user_id=user.id, record_date=today, **values)
+
+    # 先写汇总表拿到写锁，再读取当天的旧记录，保证读到的旧值就是被覆盖的那一条
+    await ensure_user_stats(db, user)
+    existing = (await db.execute(
+        select(FoodRecord.breakfast, FoodRecord.lunch, FoodRecord.dinner, FoodRecord.snack, FoodRecord.total_calories)
+        .where(FoodRecord.user_id == user.id, FoodRecord.record_date == today)
+    )).first()
+    await db.execute(
+        insert(FoodRecord).values(user_id=user.id, record_date=today, **values)
+        .on_conflict_do_update(index_elements=['user_id', 'record_date'], set_=values)
     )
-    db.add(new_record)
-    db.commit()
+    # 汇总表与饮食记录在同一个事务中更新，当天重复提交时先扣除旧值
+    await apply_food_record(db, user, existing, new_record)
+    await db.commit()
+    page_cache.invalidate(user.username)
+    await schedule_rollups(user, today)
+    await publish_update(db, user, 'food', date=today.isoformat(), **values)
 
     # 计算热量缺口/赤字
     if not user.bmr:
@@ -652,26 +572,108 @@ async def submit_detail(request: Request, username: str, db: Session = Depends(g
     })
 
 @app.post('/submit')
-async def submit_record(request: Request, db: Session = Depends(get_db)):
+async def submit_record(request: Request, db: AsyncSession = Depends(get_db)):
     data = await request.json()
-    user = db.query(User).filter(User.username == data['username']).first()
+    user = await lookup_user(db, data['username'])
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
 
     today = date.today()
-    existing = db.query(Record).filter(
-        Record.user_id == user.id,
-        Record.record_date == today
-    ).first()
-    
-    if existing:
-        raise HTTPException(status_code=400, detail="今日已记录")
-
     new_record = Record(
         user_id=user.id,
         record_date=today,
         choice=data['choice']
     )
-    db.add(new_record)
-    db.commit()
+
+    # 依靠 (user_id, record_date) 唯一索引判断今天是否已经打过卡
+    await ensure_user_stats(db, user)
+    result = await db.execute(
+        insert(Record).values(user_id=user.id, record_date=today, choice=new_record.choice)
+        .on_conflict_do_nothing(index_elements=['user_id', 'record_date'])
+    )
+    if result.rowcount == 0:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="今日已记录")
+
+    await apply_record(db, user, new_record)
+    await db.commit()
+    page_cache.invalidate(user.username)
+    await schedule_rollups(user, today)
+    await publish_update(db, user, 'record', date=today.isoformat(), choice=new_record.choice)
     return {"status": "success"}
+
+@app.post('/api/u/{username}/records')
+async def backfill_records(request: Request, user: UserInfo = Depends(get_user), db: AsyncSession = Depends(get_db)):
+    # 一次提交多天的记录（如客户端离线期间的数据），条目格式同导入：date、choice 和各餐热量
+    # 全部校验通过后在一个事务中写入，同一天已有的记录会被覆盖，汇总表最后只重建一次
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail='请求体应为 JSON')
+    items = data.get('entries') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail='entries 应为非空数组')
+    if len(items) > BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f'每次最多提交 {BATCH_SIZE} 条')
+
+    entries, errors = validate_entries(items)
+    if errors:
+        return JSONResponse(status_code=400, content={'detail': '数据格式错误', 'errors': errors})
+
+    await ensure_user_stats(db, user)
+    saved = await write_entries(db, user.id, entries)
+    await rebuild_user_stats(db, user)
+    await db.commit()
+    page_cache.invalidate(user.username)
+    return {'status': 'success', 'saved': saved}
+
+EXPORT_MEDIA_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson'}
+
+@app.get('/u/{username}/export')
+async def export_records(
+    fmt: Literal['csv', 'jsonl'] = Query('csv', alias='format'),
+    user: UserInfo = Depends(get_user)
+):
+    # 边查询边输出，不会把全部记录读入内存
+    filename = quote(f'{user.username}.{fmt}')
+    return StreamingResponse(export_chunks(user.id, fmt), media_type=EXPORT_MEDIA_TYPES[fmt], headers={
+        'Content-Disposition': f"attachment; filename*=UTF-8''{filename}"
+    })
+
+@app.post('/u/{username}/import')
+async def import_records(
+    file: UploadFile = File(...),
+    fmt: Optional[Literal['csv', 'jsonl']] = Query(None, alias='format'),
+    user: UserInfo = Depends(get_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # 格式与导出一致，没有指定 format 时按文件扩展名判断
+    if fmt is None:
+        fmt = 'jsonl' if (file.filename or '').lower().endswith(('.jsonl', '.json')) else 'csv'
+
+    # 每批一个事务，同一天已有的记录会被覆盖；出错时之前已提交的批次保留，重新导入同一个文件即可
+    imported = 0
+    batch = []
+    try:
+        for entry in iter_entries(file.file, fmt):
+            batch.append(entry)
+            if len(batch) >= BATCH_SIZE:
+                imported += await write_entries(db, user.id, batch)
+                await db.commit()
+                batch = []
+        if batch:
+            imported += await write_entries(db, user.id, batch)
+            await db.commit()
+    except (ValueError, csv.Error) as error:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f'{error}（已导入 {imported} 条）')
+    finally:
+        if imported:
+            # 汇总表在最后按原始记录重建一次，先拿写锁再读取，避免漏掉并发的打卡
+            await db.rollback()
+            await ensure_user_stats(db, user)
+            await rebuild_user_stats(db, user)
+            await db.commit()
+            page_cache.invalidate(user.username)
+
+    return {'status': 'success', 'imported': imported}
@@ -0,0 +1,265 @@
+"""运行指标
+
+以 Prometheus 文本格式在 /metrics 输出：
+    http_requests_total / http_request_duration_seconds   每个路由的请求数和耗时（由 MetricsMiddleware 记录）
+    db_queries_per_request / db_time_per_request_seconds 每个请求执行的 SQL 条数和数据库耗时（SQLAlchemy 事件）
+    template_render_seconds                               每个模板的渲染耗时（不含等待发送的时间）
+    cache_*                                               page_cache / user_cache 的命中计数
+    job_queue_depth / job_running / jobs_total            后台任务队列的排队数、执行中的任务数和累计计数（jobs.py）
+    sse_connections / sse_events_total / sse_dropped_total 事件流的连接数、推送的事件数和被丢弃的消息数（events.py）
+路由使用路由模板（如 /u/{username}），不会因为用户名不同产生大量标签。METRICS_ENABLED=0 时不记录。
+
+多 worker 部署时设置 METRICS_DIR（gunicorn.conf.py 会自动设置），每个 worker 定期把自己的数据写到该目录，
+/metrics 汇总所有 worker 的数据后输出。已退出的 worker 的计数器继续计入（总数不会倒退），gauge 不再计入。
+"""
+import contextvars
+import json
+import os
+import time
+from bisect import bisect_left
+
+ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+METRICS_DIR = os.getenv('METRICS_DIR')
+FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}  # 标签值元组 -> 计数
+
+    def inc(self, labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}  # 标签值元组 -> [各区间计数..., +Inf 区间计数, 总和, 次数]
+
+    def observe(self, labels, value):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [0] * (len(self.buckets) + 3)
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+requests_total = Counter('http_requests_total', '请求数', ('method', 'route', 'status'))
+request_duration = Histogram('http_request_duration_seconds', '请求耗时', ('method', 'route'))
+db_queries = Histogram('db_queries_per_request', '每个请求执行的 SQL 条数', ('method', 'route'), QUERY_BUCKETS)
+db_time = Histogram('db_time_per_request_seconds', '每个请求的数据库耗时', ('method', 'route'))
+template_render = Histogram('template_render_seconds', '模板渲染耗时', ('template',))
+METRICS = [requests_total, request_duration, db_queries, db_time, template_render]
+
+# 当前请求的 [SQL 条数, 数据库耗时]；SQLAlchemy 在 greenlet 中执行同步事件时会沿用调用方的上下文
+_request_db = contextvars.ContextVar('request_db', default=None)
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        current = _request_db.get()
+        if current is not None:
+            current[0] += 1
+            current[1] += time.perf_counter() - context._metrics_start
+
+def instrument_templates(env):
+    # 替换模板类，render / generate 都会记录耗时；需要在加载模板之前调用
+    base = env.template_class
+
+    class TimedTemplate(base):
+        def render(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return super().render(*args, **kwargs)
+            finally:
+                template_render.observe((self.name,), time.perf_counter() - start)
+
+        def generate(self, *args, **kwargs):
+            # 只累计生成每一段的时间，不计入两段之间等待客户端接收的时间
+            elapsed = 0.0
+            parts = super().generate(*args, **kwargs)
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        part = next(parts)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield part
+            finally:
+                template_render.observe((self.name,), elapsed)
+
+    env.template_class = TimedTemplate
+
+class MetricsMiddleware:
+    # 纯 ASGI 中间件，流式响应的耗时记到最后一段发送完为止
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def route_label(self, scope):
+        if self._routes is None:
+            self._routes = {getattr(route, 'endpoint', getattr(route, 'app', None)): route.path
+                            for route in scope['app'].routes}
+        return self._routes.get(scope.get('endpoint'), 'unmatched')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        status = 500
+        current = [0, 0.0]
+        token = _request_db.set(current)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_db.reset(token)
+            labels = (scope['method'], self.route_label(scope))
+            requests_total.inc(labels + (str(status),))
+            request_duration.observe(labels, elapsed)
+            db_queries.observe(labels, current[0])
+            db_time.observe(labels, current[1])
+
+def _cache_families():
+    from cache import page_cache, user_cache
+    families = []
+    stats = {'pages': page_cache.stats(), 'users': user_cache.stats()}
+    for field in ('hits', 'misses', 'evictions', 'invalidations'):
+        families.append((f'cache_{field}_total', 'counter', f'缓存 {field} 次数', ('cache',), {
+            (name,): values[field] for name, values in stats.items()
+        }))
+    families.append(('cache_entries', 'gauge', '缓存条目数', ('cache',), {
+        (name,): values['size'] for name, values in stats.items()
+    }))
+    return families
+
+def _job_families():
+    from jobs import job_queue
+    stats = job_queue.stats()
+    return [
+        ('job_queue_depth', 'gauge', '排队中的后台任务数', (), {(): stats['depth']}),
+        ('job_running', 'gauge', '执行中的后台任务数', (), {(): stats['running']}),
+        ('jobs_total', 'counter', '后台任务数（submitted 提交、coalesced 与排队中的任务合并、completed 完成、failed 失败）',
+         ('status',), {(status,): stats[status] for status in ('submitted', 'coalesced', 'completed', 'failed')}),
+    ]
+
+def _event_families():
+    from events import broker
+    stats = broker.stats()
+    return [
+        ('sse_connections', 'gauge', '打开的事件流连接数', (), {(): stats['connections']}),
+        ('sse_events_total', 'counter', '推送的事件数', (), {(): stats['published']}),
+        ('sse_dropped_total', 'counter', '客户端接收太慢被丢弃的消息数', (), {(): stats['dropped']}),
+    ]
+
+def snapshot():
+    # 本进程的全部数据：名称 -> (类型, 说明, 标签名, {标签值: 值}, 区间)
+    data = {m.name: (m.type, m.help, m.labels, dict(m.values), getattr(m, 'buckets', None)) for m in METRICS}
+    for name, kind, help, labels, values in _cache_families() + _job_families() + _event_families():
+        data[name] = (kind, help, labels, values, None)
+    return data
+
+def _snapshot_path(pid):
+    return os.path.join(METRICS_DIR, f'{pid}.json')
+
+def write_snapshot():
+    if not METRICS_DIR:
+        return
+    data = {name: [kind, help, labels, [[list(k), v] for k, v in values.items()], buckets]
+            for name, (kind, help, labels, values, buckets) in snapshot().items()}
+    path = _snapshot_path(os.getpid())
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+def _merge(total, data):
+    for name, (kind, help, labels, values, buckets) in data.items():
+        merged = total.setdefault(name, (kind, help, labels, {}, buckets))[3]
+        for key, value in values.items():
+            if isinstance(value, list):
+                old = merged.get(key)
+                merged[key] = value[:] if old is None else [a + b for a, b in zip(old, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def collect():
+    # 多 worker 时合并其他 worker 最近写入的数据；已退出的 worker 只保留计数器和直方图，
+    # 它最后写入的连接数、队列长度等 gauge 已经没有意义，计入会让 worker 重启后的数值一直偏大
+    if not METRICS_DIR:
+        return snapshot()
+    total = {}
+    own = f'{os.getpid()}.json'
+    for filename in os.listdir(METRICS_DIR):
+        if not filename.endswith('.json') or filename == own:
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, filename)) as f:
+                data = json.load(f)
+            alive = _alive(int(filename[:-len('.json')]))
+        except (OSError, ValueError):
+            continue
+        _merge(total, {name: (kind, help, tuple(labels),
+                              {tuple(k): v for k, v in values} if alive or kind != 'gauge' else {}, buckets)
+                       for name, (kind, help, labels, values, buckets) in data.items()})
+    _merge(total, snapshot())
+    return total
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def render():
+    lines = []
+    for name, (kind, help, labels, values, buckets) in collect().items():
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key, value in sorted(values.items()):
+            if kind != 'histogram':
+                lines.append(f'{name}{_format_labels(labels, key)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], value):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, key, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels, key)} {value[-2]}')
+            lines.append(f'{name}_count{_format_labels(labels, key)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,94 @@
+"""数据库迁移
+
+create_all 只会创建缺失的表，不会修改已有的表（例如旧版本的 data/data.db）。
+对已有表的改动按顺序写在 MIGRATIONS 中，已执行的版本号记录在 schema_version 表里（与 alembic 的 upgrade 类似）。
+新建的数据库由 create_all 直接建成最新的结构，只记录最新的版本号，不执行迁移（类似 alembic stamp head）。
+迁移只使用 SQLite 和 PostgreSQL 都支持的语句；PostgreSQL 的 DDL 也在事务中，多个节点同时启动时用咨询锁保证只有一个执行。
+"""
+from sqlalchemy import inspect, text, select, update
+
+from models import Base, Record, UserStats
+from streaks import group_streaks
+from rollups import rollup_statements
+
+def _unique_user_date(conn):
+    # 旧数据库没有唯一约束，先清理同一天的重复记录（保留最后写入的一条）再建唯一索引
+    removed = 0
+    for table in ('records', 'food_records'):
+        removed += conn.execute(text(
+            f'DELETE FROM {table} WHERE id NOT IN '
+            f'(SELECT MAX(id) FROM {table} GROUP BY user_id, record_date)'
+        )).rowcount
+        conn.execute(text(
+            f'CREATE UNIQUE INDEX IF NOT EXISTS ix_{table}_user_date ON {table} (user_id, record_date)'
+        ))
+    if removed:
+        # 删除了重复记录，汇总表需要重建
+        conn.execute(text('DELETE FROM user_stats'))
+
+def _add_column(conn, table, column, ddl):
+    # 新建的数据库已经由 create_all 建好了这一列
+    if column not in {c['name'] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+def _user_stats_version(conn):
+    _add_column(conn, 'user_stats', 'version', 'INTEGER NOT NULL DEFAULT 0')
+
+def _user_stats_streaks(conn):
+    _add_column(conn, 'user_stats', 'streak_last_date', 'DATE')
+    for column in ('current', 'longest', 'current_eat_much', 'current_not_eat_much',
+                   'longest_eat_much', 'longest_not_eat_much'):
+        _add_column(conn, 'user_stats', f'streak_{column}', 'INTEGER NOT NULL DEFAULT 0')
+    # 已有汇总行的用户从打卡记录补齐，没有汇总行的用户由启动时的 backfill_user_stats 一起计算
+    rows = conn.execute(select(Record.user_id, Record.record_date, Record.choice).order_by(
+        Record.user_id, Record.record_date
+    ))
+    for user_id, streaks in group_streaks(rows).items():
+        conn.execute(update(UserStats).where(UserStats.user_id == user_id).values(
+            **{f'streak_{key}': value for key, value in streaks.items()}
+        ))
+
+def _user_rollups(conn):
+    # user_rollups 表已由 create_all 建好，从原始记录算出所有用户的周、月汇总
+    for statement in rollup_statements():
+        conn.execute(statement)
+
+MIGRATIONS = [
+    (1, _unique_user_date),
+    (2, _user_stats_version),
+    (3, _user_stats_streaks),
+    (4, _user_rollups),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+# pg_advisory_xact_lock 的键，只要不与同一数据库中其他程序的咨询锁冲突即可
+MIGRATION_LOCK = 20240501
+
+def current_version(conn):
+    if not inspect(conn).has_table('schema_version'):
+        return None
+    return conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+
+def run_migrations(conn):
+    # 同步函数，异步引擎下通过 conn.run_sync(run_migrations) 调用；返回执行的迁移版本号
+    fresh = not inspect(conn).has_table('users')
+    Base.metadata.create_all(conn)
+    conn.execute(text('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)'))
+    if fresh:
+        conn.execute(text('INSERT INTO schema_version (version) VALUES (:version)'), {'version': LATEST_VERSION})
+        return []
+    current = current_version(conn)
+    applied = []
+    for version, migrate in MIGRATIONS:
+        if version > current:
+            migrate(conn)
+            conn.execute(text('INSERT INTO schema_version (version) VALUES (:version)'), {'version': version})
+            applied.append(version)
+    return applied
+
+async def init_db(engine):
+    async with engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            # 事务结束时自动释放；其他节点等到锁时迁移已经提交，看到的是最新版本
+            await conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': MIGRATION_LOCK})
+        return await conn.run_sync(run_migrations)
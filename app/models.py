@@ -0,0 +1,90 @@
+from sqlalchemy import Column, Integer, String, Date, Float, Index
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+class User(Base):
+    __tablename__ = 'users'
+    id = Column(Integer, primary_key=True)
+    username = Column(String(50), unique=True)
+    weight = Column(Integer)
+    height = Column(Integer)
+    age = Column(Integer)
+    gender = Column(String(10))
+    bmr = Column(Float)
+
+class FoodRecord(Base):
+    __tablename__ = 'food_records'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    record_date = Column(Date)
+    breakfast = Column(Integer)
+    lunch = Column(Integer)
+    dinner = Column(Integer)
+    snack = Column(Integer)
+    total_calories = Column(Integer)
+
+    # 每个用户每天只有一条饮食记录，同时作为 (user_id, record_date) 查询和排序的索引
+    __table_args__ = (
+        Index('ix_food_records_user_date', 'user_id', 'record_date', unique=True),
+    )
+
+class Record(Base):
+    __tablename__ = 'records'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    record_date = Column(Date)
+    choice = Column(String(20))
+
+    # 每个用户每天只能打卡一次
+    __table_args__ = (
+        Index('ix_records_user_date', 'user_id', 'record_date', unique=True),
+    )
+
+class UserStats(Base):
+    # 每个用户一行的汇总表，由 submit_record / submit_detail 增量维护
+    __tablename__ = 'user_stats'
+    user_id = Column(Integer, primary_key=True)
+    # 打卡记录
+    total_days = Column(Integer, default=0, nullable=False)
+    eat_much_count = Column(Integer, default=0, nullable=False)
+    first_record_date = Column(Date)
+    # 饮食记录（只统计大于0的餐次）
+    breakfast_total = Column(Integer, default=0, nullable=False)
+    breakfast_days = Column(Integer, default=0, nullable=False)
+    lunch_total = Column(Integer, default=0, nullable=False)
+    lunch_days = Column(Integer, default=0, nullable=False)
+    dinner_total = Column(Integer, default=0, nullable=False)
+    dinner_days = Column(Integer, default=0, nullable=False)
+    snack_total = Column(Integer, default=0, nullable=False)
+    snack_days = Column(Integer, default=0, nullable=False)
+    food_days = Column(Integer, default=0, nullable=False)
+    calories_total = Column(Integer, default=0, nullable=False)
+    calories_days = Column(Integer, default=0, nullable=False)
+    # 依赖当前BMR，修改个人设置后需要重新计算
+    qualified_deficit_days = Column(Integer, default=0, nullable=False)
+    # 连续打卡（截止 streak_last_date），打卡时 O(1) 更新，字段含义见 streaks.py
+    streak_last_date = Column(Date)
+    streak_current = Column(Integer, default=0, nullable=False, server_default='0')
+    streak_longest = Column(Integer, default=0, nullable=False, server_default='0')
+    streak_current_eat_much = Column(Integer, default=0, nullable=False, server_default='0')
+    streak_current_not_eat_much = Column(Integer, default=0, nullable=False, server_default='0')
+    streak_longest_eat_much = Column(Integer, default=0, nullable=False, server_default='0')
+    streak_longest_not_eat_much = Column(Integer, default=0, nullable=False, server_default='0')
+    # 每次写入（打卡、饮食记录、个人设置）加一，用于生成 ETag 等缓存校验
+    version = Column(Integer, default=0, nullable=False, server_default='0')
+
+class UserRollup(Base):
+    # 按周、按月的汇总（每个用户每个周期一行），由 submit_record / submit_detail 增量维护，字段含义见 rollups.py
+    __tablename__ = 'user_rollups'
+    user_id = Column(Integer, primary_key=True)
+    period = Column(String(10), primary_key=True)
+    period_start = Column(Date, primary_key=True)
+    check_in_days = Column(Integer, default=0, nullable=False)
+    eat_much_days = Column(Integer, default=0, nullable=False)
+    food_days = Column(Integer, default=0, nullable=False)
+    breakfast_total = Column(Integer, default=0, nullable=False)
+    lunch_total = Column(Integer, default=0, nullable=False)
+    dinner_total = Column(Integer, default=0, nullable=False)
+    snack_total = Column(Integer, default=0, nullable=False)
+    calories_total = Column(Integer, default=0, nullable=False)
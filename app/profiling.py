@@ -0,0 +1,168 @@
+"""单个请求的性能分析
+
+只有设置了 PROFILE_DIR 时才会启用（启动时安装中间件和 SQL 事件，未启用时没有任何额外开销）。
+对用户主页、统计页面、图表页面、图表数据和趋势接口的请求加上请求头 X-Profile（或查询参数 ?profile=）即可分析这一个请求，
+值需要等于 PROFILE_TOKEN（未设置时为 1）。分析期间另起一个线程每隔 PROFILE_INTERVAL 秒对事件循环线程采样调用栈，
+同时记录这个请求执行的每条 SQL 的起止时间。结果写到 PROFILE_DIR：
+    <时间>-<路由>-<用户名>.speedscope.json   可以在 https://www.speedscope.app 打开，包含采样和 SQL 两个视图
+    <时间>-<路由>-<用户名>.collapsed         折叠栈格式，可以用 flamegraph.pl 等工具生成火焰图
+响应头 X-Profile-File 为生成的文件名。分析前会清除该用户的页面缓存，保证这次请求真正执行渲染。
+采样的是整个事件循环线程，同时处理的其他请求也会出现在结果中，建议在没有其他流量时使用。
+"""
+import contextvars
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from starlette.routing import Match
+
+PROFILE_DIR = os.getenv('PROFILE_DIR')
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '1')
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.001'))
+PROFILED_ROUTES = ('user_page', 'charts_page', 'charts_api', 'trends_api', 'user_statistics')
+
+# 当前请求的 SQL 记录列表：(语句, 开始时间, 结束时间)
+_statements = contextvars.ContextVar('profile_statements', default=None)
+
+class Sampler(threading.Thread):
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = []  # (时间, 从外到内的 (函数名, 文件, 行号) 元组)
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            self.samples.append((time.perf_counter(), tuple(reversed(stack))))
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _statements.get() is not None:
+            context._profile_start = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        statements = _statements.get()
+        if statements is not None:
+            statements.append((' '.join(statement.split()), context._profile_start, time.perf_counter()))
+
+def _frame_name(frame):
+    name, filename, line = frame
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+def write_profile(name, start, end, samples, statements):
+    frames, index = [], {}
+
+    def frame_id(frame):
+        if frame not in index:
+            index[frame] = len(frames)
+            frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+        return index[frame]
+
+    # 每个采样的权重为到下一个采样的间隔
+    times = [at for at, _ in samples] + [end]
+    sampled = {
+        'type': 'sampled', 'name': f'{name} 采样', 'unit': 'seconds', 'startValue': 0, 'endValue': end - start,
+        'samples': [[frame_id(frame) for frame in stack] for _, stack in samples],
+        'weights': [times[i + 1] - times[i] for i in range(len(samples))]
+    }
+    events = []
+    for statement, began, finished in statements:
+        sql = frame_id(('SQL: ' + statement[:200], '<sql>', 0))
+        events.append({'type': 'O', 'frame': sql, 'at': began - start})
+        events.append({'type': 'C', 'frame': sql, 'at': finished - start})
+    evented = {
+        'type': 'evented', 'name': f'{name} SQL（{len(statements)} 条）', 'unit': 'seconds',
+        'startValue': 0, 'endValue': end - start, 'events': events
+    }
+    document = {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name, 'exporter': 'diet-self-perception', 'activeProfileIndex': 0,
+        'shared': {'frames': frames}, 'profiles': [sampled, evented]
+    }
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, name + '.speedscope.json'), 'w') as f:
+        json.dump(document, f)
+
+    collapsed = Counter(';'.join(_frame_name(frame) for frame in stack) for _, stack in samples)
+    with open(os.path.join(PROFILE_DIR, name + '.collapsed'), 'w') as f:
+        for stack, count in collapsed.most_common():
+            f.write(f'{stack} {count}\n')
+
+class ProfilingMiddleware:
+    def __init__(self, app, invalidate=None):
+        self.app = app
+        self.invalidate = invalidate  # 分析前按用户名清除缓存的回调
+        self._routes = None
+
+    def match(self, scope):
+        if self._routes is None:
+            self._routes = [route for route in scope['app'].routes if getattr(route, 'name', None) in PROFILED_ROUTES]
+        for route in self._routes:
+            matched, child_scope = route.matches(scope)
+            if matched == Match.FULL:
+                return route, child_scope['path_params']
+        return None, None
+
+    def requested(self, scope):
+        for name, value in scope['headers']:
+            if name == b'x-profile':
+                return value.decode('latin-1') == PROFILE_TOKEN
+        for pair in scope['query_string'].decode('latin-1').split('&'):
+            if pair.startswith('profile='):
+                return pair[len('profile='):] == PROFILE_TOKEN
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.requested(scope):
+            return await self.app(scope, receive, send)
+        route, params = self.match(scope)
+        if route is None:
+            return await self.app(scope, receive, send)
+
+        username = params.get('username', '')
+        if self.invalidate:
+            self.invalidate(username)
+        safe_name = re.sub(r'[^\w.-]', '_', username)
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{route.name}-{safe_name}"
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = list(message.get('headers', [])) + [(b'x-profile-file', name.encode())]
+            await send(message)
+
+        statements = []
+        token = _statements.set(statements)
+        sampler = Sampler(threading.get_ident(), PROFILE_INTERVAL)
+        # 采样线程需要拿到 GIL 才能采样，分析期间缩短线程切换间隔（默认 5ms），结束后恢复
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, PROFILE_INTERVAL))
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end = time.perf_counter()
+            sampler.stop()
+            sys.setswitchinterval(switch_interval)
+            _statements.reset(token)
+            write_profile(name, start, end, sampler.samples, statements)
@@ -0,0 +1,31 @@
+"""按客户端限流
+
+令牌桶：每个客户端每秒补充 rate 个令牌，最多积攒 burst 个，每个请求消耗一个。
+只记录最近活跃的 max_clients 个客户端，rate 为 0 时不限流。
+"""
+import time
+from collections import OrderedDict
+
+class RateLimiter:
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # key -> (令牌数, 上次补充时间)
+        self.rejected = 0
+
+    def allow(self, key):
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        else:
+            self.rejected += 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return allowed
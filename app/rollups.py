@@ -0,0 +1,179 @@
+"""按周、按月的汇总
+
+每条打卡和饮食记录计入所在周（周一开始）和所在月各一行。submit_record / submit_detail 提交后由后台任务（jobs.py）
+按原始记录重算当天所在的周和月，不占用表单提交的响应时间；批量补录、导入和 admin.py rebuild-stats 在事务中整体重建。
+趋势接口只读取时间范围内的周期行：一年按周约 53 行，五年按月约 61 行，与天数无关。
+    check_in_days / eat_much_days   打卡天数、吃多了的天数
+    food_days                       有饮食记录的天数
+    <餐次>_total / calories_total   各餐及全天热量总和
+热量缺口依赖当前 BMR，不存入表中，读取时按 BMR 减去平均热量计算（与图表接口一致）。
+"""
+from datetime import timedelta
+
+import numpy as np
+
+from sqlalchemy import select, update, delete, case, func, literal, union_all, Date
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Record, FoodRecord, UserStats, UserRollup
+from database import insert
+
+PERIODS = ('week', 'month')
+MEALS = ('breakfast', 'lunch', 'dinner', 'snack')
+COUNT_COLUMNS = ('check_in_days', 'eat_much_days', 'food_days') + tuple(f'{meal}_total' for meal in MEALS) + ('calories_total',)
+
+def period_start(period, day):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+class week_start(FunctionElement):
+    # 所在周的周一，按数据库分别编译
+    type = Date()
+    inherit_cache = True
+
+class month_start(FunctionElement):
+    type = Date()
+    inherit_cache = True
+
+@compiles(week_start, 'sqlite')
+def _week_start_sqlite(element, compiler, **kw):
+    return f"date({compiler.process(element.clauses, **kw)}, '-6 days', 'weekday 1')"
+
+@compiles(week_start, 'postgresql')
+def _week_start_postgresql(element, compiler, **kw):
+    # date_trunc 的一周从周一开始
+    return f"CAST(date_trunc('week', {compiler.process(element.clauses, **kw)}) AS DATE)"
+
+@compiles(month_start, 'sqlite')
+def _month_start_sqlite(element, compiler, **kw):
+    return f"date({compiler.process(element.clauses, **kw)}, 'start of month')"
+
+@compiles(month_start, 'postgresql')
+def _month_start_postgresql(element, compiler, **kw):
+    return f"CAST(date_trunc('month', {compiler.process(element.clauses, **kw)}) AS DATE)"
+
+def _period_start_sql(period, column):
+    # 与 period_start 相同：所在周的周一或所在月的1日
+    return week_start(column) if period == 'week' else month_start(column)
+
+def period_end(period, start):
+    # 下一个周期的开始日期
+    if period == 'week':
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+def _rollup_select(period, user_ids=None, start=None, end=None):
+    # 打卡和饮食记录合并后一次分组；start / end 限定日期范围（不含 end）
+    zeros = {name: literal(0) for name in COUNT_COLUMNS}
+    records = select(
+        Record.user_id.label('user_id'),
+        _period_start_sql(period, Record.record_date).label('period_start'),
+        *[column.label(name) for name, column in dict(
+            zeros, check_in_days=literal(1), eat_much_days=case((Record.choice == 'eat_much', 1), else_=0)
+        ).items()]
+    )
+    food = select(
+        FoodRecord.user_id.label('user_id'),
+        _period_start_sql(period, FoodRecord.record_date).label('period_start'),
+        *[column.label(name) for name, column in dict(
+            zeros, food_days=literal(1), calories_total=func.coalesce(FoodRecord.total_calories, 0),
+            **{f'{meal}_total': func.coalesce(getattr(FoodRecord, meal), 0) for meal in MEALS}
+        ).items()]
+    )
+    if user_ids is not None:
+        records = records.where(Record.user_id.in_(user_ids))
+        food = food.where(FoodRecord.user_id.in_(user_ids))
+    if start is not None:
+        records = records.where(Record.record_date >= start, Record.record_date < end)
+        food = food.where(FoodRecord.record_date >= start, FoodRecord.record_date < end)
+    rows = union_all(records, food).subquery()
+    return select(
+        rows.c.user_id, literal(period), rows.c.period_start,
+        *[func.sum(rows.c[name]) for name in COUNT_COLUMNS]
+    ).group_by(rows.c.user_id, rows.c.period_start)
+
+def rollup_statements(user_ids=None):
+    # 从原始表重建汇总的语句，同步连接（迁移）和异步会话都可以执行；user_ids 为空时重建全部用户
+    query = delete(UserRollup)
+    if user_ids is not None:
+        query = query.where(UserRollup.user_id.in_(user_ids))
+    statements = [query]
+    for period in PERIODS:
+        statements.append(insert(UserRollup).from_select(
+            ['user_id', 'period', 'period_start', *COUNT_COLUMNS], _rollup_select(period, user_ids)
+        ))
+    return statements
+
+async def refresh_rollups(db: AsyncSession, user_id, day):
+    """按原始记录重算 day 所在的周和月两行，可以重复执行；数据版本加一，趋势接口的 ETag 随之变化。"""
+    # 先更新该用户的汇总行拿到写锁（PostgreSQL 为行锁），同一用户的重算依次执行，
+    # 之后读取原始记录不会与并发的写入交错，多个节点同时重算也不会插入重复的周期行
+    await db.execute(update(UserStats).where(UserStats.user_id == user_id).values(version=UserStats.version + 1))
+    for period in PERIODS:
+        start = period_start(period, day)
+        await db.execute(delete(UserRollup).where(
+            UserRollup.user_id == user_id, UserRollup.period == period, UserRollup.period_start == start
+        ))
+        await db.execute(insert(UserRollup).from_select(
+            ['user_id', 'period', 'period_start', *COUNT_COLUMNS],
+            _rollup_select(period, [user_id], start, period_end(period, start))
+        ))
+
+async def rebuild_rollups(db: AsyncSession, user_ids=None, batch_size=500):
+    # 按批重建，用户很多时 IN 列表也不会超过 SQLite 的参数个数限制
+    if user_ids is None:
+        batches = [None]
+    else:
+        user_ids = list(user_ids)
+        batches = [user_ids[i:i + batch_size] for i in range(0, len(user_ids), batch_size)]
+    for batch in batches:
+        for statement in rollup_statements(batch):
+            await db.execute(statement)
+
+def _periods(period, first, end_date):
+    # first 到 end_date 之间每个周期的开始日期
+    if period == 'week':
+        return np.arange(np.datetime64(first, 'D'), np.datetime64(end_date, 'D') + 1, 7)
+    months = np.arange(np.datetime64(first, 'M'), np.datetime64(end_date, 'M') + 1)
+    return months.astype('datetime64[D]')
+
+def _ratios(totals, days, digits=1):
+    # 按周期求平均，没有记录的周期为 None
+    values = np.round(totals / np.maximum(days, 1), digits).tolist()
+    return [value if day else None for value, day in zip(values, days.tolist())]
+
+async def load_trends(db: AsyncSession, user, period, start_date, end_date):
+    """返回 start_date 到 end_date 所在的每个周期的趋势，没有记录的周期计数为 0、平均值为 None。"""
+    first = period_start(period, start_date)
+    rows = (await db.execute(
+        select(UserRollup.period_start, *[getattr(UserRollup, name) for name in COUNT_COLUMNS]).where(
+            UserRollup.user_id == user.id,
+            UserRollup.period == period,
+            UserRollup.period_start >= first,
+            UserRollup.period_start <= end_date
+        ).order_by(UserRollup.period_start)
+    )).all()
+
+    # 把周期行放进按周期下标的稠密数组，后面的平均值都是向量运算
+    periods = _periods(period, first, end_date)
+    index = np.searchsorted(periods, np.array([row[0] for row in rows], dtype='datetime64[D]'))
+    counts = {name: np.zeros(len(periods), dtype=np.int64) for name in COUNT_COLUMNS}
+    for offset, name in enumerate(COUNT_COLUMNS, start=1):
+        counts[name][index] = [row[offset] for row in rows]
+
+    food_days = counts['food_days']
+    avg_calories = counts['calories_total'] / np.maximum(food_days, 1)
+    return {
+        'period': period,
+        'bmr': user.bmr,
+        'periods': periods.astype(str).tolist(),
+        'check_in_days': counts['check_in_days'].tolist(),
+        'eat_much_ratio': _ratios(counts['eat_much_days'], counts['check_in_days'], 3),
+        'food_days': food_days.tolist(),
+        'avg_calories': _ratios(counts['calories_total'], food_days),
+        'avg_deficit': _ratios((user.bmr - avg_calories) * food_days, food_days) if user.bmr else [None] * len(periods),
+        'avg_meals': {meal: _ratios(counts[f'{meal}_total'], food_days) for meal in MEALS}
+    }
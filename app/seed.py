@@ -0,0 +1,115 @@
+"""生成测试数据
+
+按用户逐批生成 users、records、food_records，并为这些用户计算 user_stats 和周、月汇总，内存占用只与批大小有关。
+每个用户有自己的打卡概率、吃多了的概率和各餐的基础热量，同一个随机种子生成的数据完全相同。
+记录截止到昨天，基准测试中当天的 /submit 不会因为已经打过卡而失败。
+"""
+import random
+from datetime import date, timedelta
+
+import numpy as np
+
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import User
+from stats import compute_user_stats, empty_user_stats
+from rollups import rebuild_rollups
+from users import calculate_bmr
+
+MEAL_BASE = {'breakfast': (200, 500), 'lunch': (500, 900), 'dinner': (400, 900), 'snack': (0, 300)}
+
+def _user_row(user_id, username, rnd):
+    gender = rnd.choice(('male', 'female'))
+    weight = rnd.randint(50, 95) if gender == 'male' else rnd.randint(42, 80)
+    height = rnd.randint(160, 190) if gender == 'male' else rnd.randint(150, 178)
+    age = rnd.randint(18, 65)
+    return {
+        'id': user_id, 'username': username, 'weight': weight, 'height': height, 'age': age,
+        'gender': gender, 'bmr': calculate_bmr(gender, weight, height, age)
+    }
+
+def _user_days(user_id, dates, rng):
+    # 返回 (records, food_records) 两个元组列表；一个用户的习惯在整段时间内保持不变
+    days = len(dates)
+    check_in, log_food, eat_much = rng.uniform(0.5, 0.98), rng.uniform(0.3, 0.95), rng.uniform(0.1, 0.6)
+    checked = np.flatnonzero(rng.random(days) < check_in)
+    choices = np.where(rng.random(len(checked)) < eat_much, 'eat_much', 'not_eat_much')
+    records = [(user_id, dates[i], choice) for i, choice in zip(checked.tolist(), choices.tolist())]
+
+    logged = np.flatnonzero(rng.random(days) < log_food)
+    meals = []
+    for low, high in MEAL_BASE.values():
+        base = rng.uniform(low, high)
+        values = np.maximum(rng.normal(base, base * 0.25, len(logged)), 0).astype(np.int64)
+        values[rng.random(len(logged)) < rng.uniform(0, 0.3)] = 0
+        meals.append(values)
+    totals = sum(meals)
+    food_records = [
+        (user_id, dates[i], *row)
+        for i, row in zip(logged.tolist(), np.column_stack(meals + [totals]).tolist())
+    ]
+    return records, food_records
+
+RECORD_INSERT = 'INSERT INTO records (user_id, record_date, choice) VALUES ({})'
+FOOD_INSERT = (
+    'INSERT INTO food_records (user_id, record_date, breakfast, lunch, dinner, snack, total_calories) '
+    'VALUES ({})'
+)
+
+def _driver_sql(dialect, template, count):
+    # 驱动自己的参数格式：sqlite3 为 ?，asyncpg 为 $1
+    if dialect.paramstyle == 'numeric_dollar':
+        return template.format(', '.join(f'${i}' for i in range(1, count + 1)))
+    return template.format(', '.join('?' * count))
+
+async def seed(db: AsyncSession, users, days, prefix='seed', random_seed=0, batch_users=200, progress=None):
+    # 用户 id 接在已有用户之后；返回生成的 (用户数, 打卡记录数, 饮食记录数)
+    # 记录量很大，绕过 ORM 直接用驱动的 executemany 写入元组
+    start_id = (await db.scalar(select(func.max(User.id))) or 0) + 1
+    rnd = random.Random(random_seed)
+    rng = np.random.default_rng(random_seed)
+    end = date.today() - timedelta(days=1)
+    connection = await db.connection()
+    dates = [end - timedelta(days=offset) for offset in range(days - 1, -1, -1)]
+    if connection.dialect.name == 'sqlite':
+        # sqlite3 直接写入日期字符串，与 ORM 写入的格式相同
+        dates = [day.isoformat() for day in dates]
+    record_insert = _driver_sql(connection.dialect, RECORD_INSERT, 3)
+    food_insert = _driver_sql(connection.dialect, FOOD_INSERT, 7)
+    totals = [0, 0, 0]
+    for batch_start in range(0, users, batch_users):
+        user_rows, records, food_records = [], [], []
+        for i in range(batch_start, min(users, batch_start + batch_users)):
+            user_id = start_id + i
+            user_rows.append(_user_row(user_id, f'{prefix}{i}', rnd))
+            user_records, user_food = _user_days(user_id, dates, rng)
+            records.extend(user_records)
+            food_records.extend(user_food)
+
+        await db.execute(User.__table__.insert(), user_rows)
+        connection = await db.connection()
+        if records:
+            await connection.exec_driver_sql(record_insert, records)
+        if food_records:
+            await connection.exec_driver_sql(food_insert, food_records)
+        user_ids = [row['id'] for row in user_rows]
+        computed = await compute_user_stats(db, user_ids)
+        db.add_all(computed.get(user_id) or empty_user_stats(user_id) for user_id in user_ids)
+        await rebuild_rollups(db, user_ids)
+        await db.commit()
+        db.expunge_all()
+
+        totals[0] += len(user_rows)
+        totals[1] += len(records)
+        totals[2] += len(food_records)
+        if progress:
+            progress(*totals)
+    if users and db.bind.dialect.name == 'postgresql':
+        # 用户 id 是直接指定的，序列没有前进，之后注册的用户会从已用过的 id 开始
+        await db.execute(text("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT MAX(id) FROM users))"))
+        await db.commit()
+    return tuple(totals)
+
+async def seeded_usernames(db: AsyncSession, prefix='seed'):
+    return (await db.scalars(select(User.username).where(User.username.like(f'{prefix}%')).order_by(User.id))).all()
@@ -0,0 +1,79 @@
+"""图表时间序列计算
+
+把一段时间内的记录转换成按天下标的稠密数组，每日热量、热量缺口、打卡标记、
+连续打卡天数和按星期的平均热量都用向量运算得到，时间范围再长也不需要逐天循环。
+"""
+import numpy as np
+
+from streaks import daily_streaks
+
+MEALS = ('breakfast', 'lunch', 'dinner', 'snack')
+
+def _ordinals(rows):
+    # date.toordinal() 比把 date 对象直接转换成 datetime64 快得多
+    return np.fromiter((row[0].toordinal() for row in rows), dtype=np.int64, count=len(rows))
+
+def _column(rows, index):
+    # 空值按 0 处理
+    return np.array([row[index] or 0 for row in rows], dtype=np.int64)
+
+def weekday_means(ordinals, values):
+    # 按星期（周日=0 到周六=6）求平均，没有记录的星期为 0；公元1年1月1日是星期一
+    weekdays = ordinals % 7
+    counts = np.bincount(weekdays, minlength=7)
+    sums = np.bincount(weekdays, weights=values, minlength=7)
+    return sums / np.maximum(counts, 1)
+
+def build_chart_series(start_date, end_date, bmr, food_rows, record_rows):
+    """food_rows 为 (record_date, breakfast, lunch, dinner, snack, total_calories)，
+    record_rows 为 (record_date, choice)，返回与图表接口一致的字典。"""
+    start = start_date.toordinal()
+    size = end_date.toordinal() - start + 1
+
+    food_days = _ordinals(food_rows)
+    food_index = food_days - start
+    in_range = (food_index >= 0) & (food_index < size)
+    totals = _column(food_rows, 5)
+
+    calories = np.zeros(size, dtype=np.int64)
+    calories[food_index[in_range]] = totals[in_range]
+
+    if bmr:
+        calorie_deficit = np.zeros(size)
+        calorie_deficit[food_index[in_range]] = bmr - totals[in_range]
+    else:
+        calorie_deficit = np.zeros(size, dtype=np.int64)
+
+    record_index = _ordinals(record_rows) - start
+    choices = np.array([row[1] for row in record_rows], dtype=object)
+    record_in_range = (record_index >= 0) & (record_index < size)
+    record_index, choices = record_index[record_in_range], choices[record_in_range]
+
+    present = np.zeros(size, dtype=bool)
+    present[record_index] = True
+    eat_much = np.zeros(size, dtype=np.int64)
+    eat_much[record_index] = choices == 'eat_much'
+    not_eat_much = np.zeros(size, dtype=np.int64)
+    not_eat_much[record_index] = choices == 'not_eat_much'
+
+    meals = {}
+    eating_patterns = {}
+    for offset, meal in enumerate(MEALS, start=1):
+        values = _column(food_rows, offset)
+        meals[meal] = int(values.sum())
+        # 四舍五入用 Python 的 round，保证与逐条计算的结果一致
+        eating_patterns[meal] = [round(value, 1) for value in weekday_means(food_days, values).tolist()]
+
+    return {
+        'dates': np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + 1).astype(str).tolist(),
+        'calories': calories.tolist(),
+        'bmr': bmr,
+        'meals': meals,
+        'eating_habits': {
+            'eat_much': eat_much.tolist(),
+            'not_eat_much': not_eat_much.tolist()
+        },
+        'calorie_deficit': calorie_deficit.tolist(),
+        'eating_patterns': eating_patterns,
+        'streaks': daily_streaks(present).tolist()
+    }
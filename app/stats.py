@@ -0,0 +1,243 @@
+from datetime import date, timedelta
+
+from sqlalchemy import select, update, case, func, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import User, Record, FoodRecord, UserStats
+from database import IS_SQLITE, insert
+from streaks import empty_streaks, advance_streaks, group_streaks, load_streaks
+from rollups import rebuild_rollups
+
+MEALS = ('breakfast', 'lunch', 'dinner', 'snack')
+
+def is_qualified_deficit(bmr, total_calories):
+    # 假设合理的热量缺口为0-500大卡
+    return bool(bmr) and 0 < bmr - (total_calories or 0) <= 500
+
+def _food_deltas(food_record, bmr, sign, deltas):
+    # 把一条饮食记录对汇总表的贡献累加到 deltas 中，sign 为 1（新增）或 -1（移除）
+    for meal in MEALS:
+        value = getattr(food_record, meal) or 0
+        if value > 0:
+            deltas[f'{meal}_total'] = deltas.get(f'{meal}_total', 0) + sign * value
+            deltas[f'{meal}_days'] = deltas.get(f'{meal}_days', 0) + sign
+    total = food_record.total_calories or 0
+    deltas['food_days'] = deltas.get('food_days', 0) + sign
+    deltas['calories_total'] = deltas.get('calories_total', 0) + sign * total
+    if total:
+        deltas['calories_days'] = deltas.get('calories_days', 0) + sign
+    if is_qualified_deficit(bmr, total):
+        deltas['qualified_deficit_days'] = deltas.get('qualified_deficit_days', 0) + sign
+    return deltas
+
+async def _apply_deltas(db: AsyncSession, user_id, deltas, **values):
+    # 用 col = col + delta 的形式更新，避免读-改-写
+    values.update({
+        name: getattr(UserStats, name) + delta
+        for name, delta in deltas.items() if delta
+    })
+    values['version'] = UserStats.version + 1
+    await db.execute(update(UserStats).where(UserStats.user_id == user_id).values(**values))
+
+def streak_values(streaks):
+    # streaks.py 中的字段对应 user_stats 中 streak_ 开头的列
+    return {f'streak_{key}': value for key, value in streaks.items()}
+
+def get_streaks(user_stats):
+    return {key: getattr(user_stats, f'streak_{key}') for key in empty_streaks()}
+
+async def _read_streaks(db: AsyncSession, user_id):
+    keys = list(empty_streaks())
+    row = (await db.execute(
+        select(*[getattr(UserStats, f'streak_{key}') for key in keys]).where(UserStats.user_id == user_id)
+    )).one()
+    return dict(zip(keys, row))
+
+def empty_user_stats(user_id):
+    return UserStats(
+        user_id=user_id,
+        total_days=0, eat_much_count=0, first_record_date=None,
+        breakfast_total=0, breakfast_days=0, lunch_total=0, lunch_days=0,
+        dinner_total=0, dinner_days=0, snack_total=0, snack_days=0,
+        food_days=0, calories_total=0, calories_days=0,
+        qualified_deficit_days=0,
+        **streak_values(empty_streaks())
+    )
+
+def _food_aggregate_columns():
+    # 一次分组查询算出所有饮食相关的汇总值
+    columns = []
+    for meal in MEALS:
+        value = getattr(FoodRecord, meal)
+        columns.append(func.coalesce(func.sum(case((value > 0, value), else_=0)), 0).label(f'{meal}_total'))
+        columns.append(func.count(case((value > 0, 1))).label(f'{meal}_days'))
+    total = func.coalesce(FoodRecord.total_calories, 0)
+    deficit = User.bmr - total
+    columns += [
+        func.count().label('food_days'),
+        func.coalesce(func.sum(total), 0).label('calories_total'),
+        func.count(case((total != 0, 1))).label('calories_days'),
+        func.count(case((and_(deficit > 0, deficit <= 500), 1))).label('qualified_deficit_days'),
+    ]
+    return columns
+
+async def compute_user_stats(db: AsyncSession, user_ids=None):
+    # 从原始表计算汇总，返回 {user_id: UserStats}；user_ids 为空时计算全部用户
+    result = {}
+
+    record_query = select(
+        Record.user_id,
+        func.count().label('total_days'),
+        func.count(case((Record.choice == 'eat_much', 1))).label('eat_much_count'),
+        func.min(Record.record_date).label('first_record_date'),
+    ).group_by(Record.user_id)
+    food_query = select(FoodRecord.user_id, *_food_aggregate_columns()).join(
+        User, User.id == FoodRecord.user_id
+    ).group_by(FoodRecord.user_id)
+    if user_ids is not None:
+        record_query = record_query.where(Record.user_id.in_(user_ids))
+        food_query = food_query.where(FoodRecord.user_id.in_(user_ids))
+
+    for query in (record_query, food_query):
+        for row in (await db.execute(query)).mappings():
+            stats = result.setdefault(row['user_id'], empty_user_stats(row['user_id']))
+            for name, value in row.items():
+                setattr(stats, name, value)
+    for user_id, streaks in (await compute_streaks(db, user_ids)).items():
+        stats = result.setdefault(user_id, empty_user_stats(user_id))
+        for name, value in streak_values(streaks).items():
+            setattr(stats, name, value)
+    return result
+
+async def compute_streaks(db: AsyncSession, user_ids=None):
+    # 按 (user_id, record_date) 索引顺序读取打卡记录，一次遍历算出每个用户的连续天数
+    query = select(Record.user_id, Record.record_date, Record.choice).order_by(Record.user_id, Record.record_date)
+    if user_ids is not None:
+        query = query.where(Record.user_id.in_(user_ids))
+    return group_streaks((await db.execute(query)).all())
+
+async def rebuild_user_stats(db: AsyncSession, user):
+    stats = (await compute_user_stats(db, [user.id])).get(user.id) or empty_user_stats(user.id)
+    await db.merge(stats)
+    await db.flush()
+    # 重建后数据可能变化，版本号加一让缓存失效（merge 不会覆盖已有的 version）
+    await db.execute(update(UserStats).where(UserStats.user_id == user.id).values(version=UserStats.version + 1))
+    await rebuild_rollups(db, [user.id])
+    return stats
+
+async def rebuild_all_user_stats(db: AsyncSession, users):
+    computed = await compute_user_stats(db)
+    for user in users:
+        await db.merge(computed.get(user.id) or empty_user_stats(user.id))
+    await db.flush()
+    await db.execute(update(UserStats).values(version=UserStats.version + 1))
+    await rebuild_rollups(db, [user.id for user in users])
+    return len(users)
+
+async def rebuild_streaks(db: AsyncSession, users):
+    # 只重建连续打卡相关的列
+    computed = await compute_streaks(db, [user.id for user in users])
+    for user in users:
+        await ensure_user_stats(db, user)
+        await db.execute(update(UserStats).where(UserStats.user_id == user.id).values(
+            version=UserStats.version + 1,
+            **streak_values(computed.get(user.id) or empty_streaks())
+        ))
+    return len(users)
+
+async def backfill_user_stats(db: AsyncSession):
+    # 为还没有汇总行的用户补齐数据（升级已有数据库时）
+    users = (await db.execute(
+        select(User).outerjoin(UserStats, UserStats.user_id == User.id).where(UserStats.user_id.is_(None))
+    )).scalars().all()
+    if users:
+        await rebuild_all_user_stats(db, users)
+        await db.commit()
+    return len(users)
+
+async def get_user_stats(db: AsyncSession, user):
+    # 只读：没有汇总行的用户（还没有任何记录）返回全零
+    stats = await db.get(UserStats, user.id)
+    return stats if stats is not None else empty_user_stats(user.id)
+
+def overview_stats(user_stats, bmr):
+    # 用户主页“统计概览”的数值；最近一次打卡是今天或昨天时连续天数还没有中断（今天可能还没打卡），更早则按 0 显示
+    total_days = user_stats.total_days
+    eat_much_count = user_stats.eat_much_count
+    not_eat_much_count = total_days - eat_much_count
+    last_date = user_stats.streak_last_date
+    streak_ongoing = last_date is not None and last_date >= date.today() - timedelta(days=1)
+    avg_daily_calories = round(user_stats.calories_total / user_stats.calories_days, 1) if user_stats.calories_days else 0
+    stats = {
+        'total_days': total_days,
+        'eat_much_count': eat_much_count,
+        'eat_much_percent': round(eat_much_count / total_days * 100, 1) if total_days > 0 else 0,
+        'not_eat_much_count': not_eat_much_count,
+        'not_eat_much_percent': round(not_eat_much_count / total_days * 100, 1) if total_days > 0 else 0,
+        'consecutive_days': user_stats.streak_current if streak_ongoing else 0,
+        'avg_calorie_deficit': round(bmr - avg_daily_calories, 1) if bmr and avg_daily_calories else 0,
+    }
+    for meal in MEALS:
+        days = getattr(user_stats, f'{meal}_days')
+        stats[f'avg_{meal}_calories'] = round(getattr(user_stats, f'{meal}_total') / days, 1) if days else 0
+    return stats
+
+async def get_user_version(db: AsyncSession, user):
+    return await db.scalar(select(UserStats.version).where(UserStats.user_id == user.id)) or 0
+
+async def ensure_user_stats(db: AsyncSession, user):
+    # 已有记录的用户在启动时都已补齐汇总行，缺失的只可能是还没有任何记录的新用户，插入全零即可。
+    # 这是一条写语句，放在事务开头可以先拿到写锁，之后读取旧记录再写入不会被并发请求打断。
+    # PostgreSQL 没有整个数据库的写锁，而已有的行 DO NOTHING 不会加锁，再锁住这一行，同一用户的写入依次执行
+    stats = empty_user_stats(user.id)
+    await db.execute(
+        insert(UserStats).values(**{
+            column.name: getattr(stats, column.name)
+            for column in UserStats.__table__.columns if column.name != 'version'
+        }).on_conflict_do_nothing(index_elements=['user_id'])
+    )
+    if not IS_SQLITE:
+        await db.execute(select(UserStats.user_id).where(UserStats.user_id == user.id).with_for_update())
+
+async def apply_record(db: AsyncSession, user, record):
+    # 调用前需要先 ensure_user_stats，此时已持有写锁，读取连续天数后再写回不会与其他请求交错
+    streaks = await _read_streaks(db, user.id)
+    if streaks['last_date'] is None or streaks['last_date'] < record.record_date:
+        advance_streaks(streaks, record.record_date, record.choice)
+    else:
+        # 补录了更早的日期，只能按全部记录重新计算
+        streaks = await load_streaks(db, user.id)
+    await _apply_deltas(
+        db, user.id,
+        {'total_days': 1, 'eat_much_count': 1 if record.choice == 'eat_much' else 0},
+        first_record_date=case(
+            (UserStats.first_record_date.is_(None), record.record_date),
+            (UserStats.first_record_date > record.record_date, record.record_date),
+            else_=UserStats.first_record_date
+        ),
+        **streak_values(streaks)
+    )
+
+async def apply_food_record(db: AsyncSession, user, old, new):
+    # 当天修改饮食记录时 old 为被替换的旧值；调用前需要先 ensure_user_stats
+    deltas = {}
+    if old is not None:
+        _food_deltas(old, user.bmr, -1, deltas)
+    _food_deltas(new, user.bmr, 1, deltas)
+    await _apply_deltas(db, user.id, deltas)
+
+async def refresh_qualified_deficit(db: AsyncSession, user):
+    # BMR 变化后，合格热量缺口天数需要按新的BMR重新统计
+    await ensure_user_stats(db, user)
+    qualified_days = 0
+    if user.bmr:
+        deficit = user.bmr - func.coalesce(FoodRecord.total_calories, 0)
+        qualified_days = await db.scalar(
+            select(func.count()).select_from(FoodRecord).where(
+                FoodRecord.user_id == user.id, deficit > 0, deficit <= 500
+            )
+        )
+    await db.execute(update(UserStats).where(UserStats.user_id == user.id).values(
+        qualified_deficit_days=qualified_days,
+        version=UserStats.version + 1
+    ))
@@ -0,0 +1,66 @@
+"""连续打卡天数
+
+“连续”指日期相邻：中间缺一天就重新计数。current_* 是截止最后一次打卡的连续天数，
+是否还算“当前”（例如要求今天已打卡）由页面自己判断。
+"""
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Record
+
+def _normalize(choice):
+    # 与页面统计一致：除了 eat_much 都算作没吃多
+    return 'eat_much' if choice == 'eat_much' else 'not_eat_much'
+
+def empty_streaks():
+    return {
+        'last_date': None,
+        'current': 0, 'longest': 0,
+        'current_eat_much': 0, 'current_not_eat_much': 0,
+        'longest_eat_much': 0, 'longest_not_eat_much': 0
+    }
+
+def advance_streaks(streaks, record_date, choice):
+    # 追加一天（日期必须晚于 last_date），O(1) 更新所有计数
+    choice = _normalize(choice)
+    other = 'not_eat_much' if choice == 'eat_much' else 'eat_much'
+    last_date = streaks['last_date']
+    adjacent = last_date is not None and (record_date - last_date).days == 1
+    streaks['current'] = streaks['current'] + 1 if adjacent else 1
+    streaks[f'current_{choice}'] = streaks[f'current_{choice}'] + 1 if adjacent else 1
+    streaks[f'current_{other}'] = 0
+    streaks['longest'] = max(streaks['longest'], streaks['current'])
+    streaks[f'longest_{choice}'] = max(streaks[f'longest_{choice}'], streaks[f'current_{choice}'])
+    streaks['last_date'] = record_date
+    return streaks
+
+def summarize_streaks(rows):
+    # rows 为按日期升序排列的 (record_date, choice)，一次遍历
+    streaks = empty_streaks()
+    for record_date, choice in rows:
+        advance_streaks(streaks, record_date, choice)
+    return streaks
+
+def group_streaks(rows):
+    # rows 为按 (user_id, record_date) 排序的 (user_id, record_date, choice)，返回 {user_id: streaks}
+    result = {}
+    for user_id, record_date, choice in rows:
+        streaks = result.get(user_id)
+        if streaks is None:
+            streaks = result[user_id] = empty_streaks()
+        advance_streaks(streaks, record_date, choice)
+    return result
+
+async def load_streaks(db: AsyncSession, user_id):
+    # 只取两列，按日期升序一次遍历
+    rows = (await db.execute(select(Record.record_date, Record.choice).where(
+        Record.user_id == user_id
+    ).order_by(Record.record_date))).all()
+    return summarize_streaks(rows)
+
+def daily_streaks(present):
+    # 图表用：每一天截止当天的连续打卡天数，即到上一个未打卡日的距离，未打卡的当天为 0
+    index = np.arange(len(present))
+    last_gap = np.maximum.accumulate(np.where(present, -1, index))
+    return np.where(present, index - last_gap, 0)
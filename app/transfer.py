@@ -0,0 +1,180 @@
+"""记录的导入导出
+
+导出时按天合并 records 和 food_records：两张表各自按 (user_id, record_date) 索引顺序流式读取，
+在 Python 中按日期归并，内存占用与历史记录的多少无关。导入按批次 executemany，
+同一天已有的记录会被覆盖。每一行的格式为:
+    date, choice, breakfast, lunch, dinner, snack, total_calories
+其中 choice 和各餐热量可以为空，total_calories 只在导出时提供，导入时按各餐重新计算。
+"""
+import csv
+import io
+import json
+from datetime import date
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Record, FoodRecord
+from database import SessionLocal, insert
+
+MEALS = ('breakfast', 'lunch', 'dinner', 'snack')
+FIELDS = ('date', 'choice') + MEALS + ('total_calories',)
+CHOICES = ('eat_much', 'not_eat_much')
+BATCH_SIZE = 1000
+
+class EntryError(ValueError):
+    def __init__(self, line_no, message):
+        super().__init__(f'第 {line_no} 行：{message}')
+
+def validate_entry(data):
+    # 返回 (record_date, choice, food)，choice 和 food 可以有一个为 None；格式错误时抛出 ValueError
+    try:
+        record_date = date.fromisoformat(str(data.get('date') or '').strip())
+    except ValueError:
+        raise ValueError('date 格式应为 YYYY-MM-DD') from None
+    if record_date > date.today():
+        raise ValueError('不能记录未来的日期')
+
+    choice = data.get('choice') or None
+    if choice is not None and choice not in CHOICES:
+        raise ValueError(f"choice 只能是 {' 或 '.join(CHOICES)}")
+
+    meals = {}
+    for meal in MEALS:
+        value = data.get(meal)
+        if value is None or value == '':
+            continue
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{meal} 应为整数') from None
+        if value < 0:
+            raise ValueError(f'{meal} 不能为负数')
+        meals[meal] = value
+    food = None
+    if meals:
+        food = {meal: meals.get(meal, 0) for meal in MEALS}
+        food['total_calories'] = sum(food.values())
+
+    if choice is None and food is None:
+        raise ValueError('没有打卡或饮食数据')
+    return record_date, choice, food
+
+def validate_entries(items):
+    # 批量提交时一次校验全部条目，返回 (entries, errors)，errors 中每一项为 {'index', 'error'}
+    entries, errors, seen = [], [], set()
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('每一项应为一个 JSON 对象')
+            entry = validate_entry(item)
+            if entry[0] in seen:
+                raise ValueError(f'日期 {entry[0].isoformat()} 重复')
+            seen.add(entry[0])
+            entries.append(entry)
+        except ValueError as error:
+            errors.append({'index': index, 'error': str(error)})
+    return entries, errors
+
+def iter_entries(file, fmt):
+    # file 为二进制文件对象，逐行读取并校验，不会把整个文件读入内存
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            rows = enumerate(csv.DictReader(text), start=2)
+        else:
+            rows = ((line_no, line) for line_no, line in enumerate(text, start=1) if line.strip())
+        for line_no, row in rows:
+            try:
+                if fmt == 'jsonl':
+                    row = json.loads(row)
+                    if not isinstance(row, dict):
+                        raise ValueError('每行应为一个 JSON 对象')
+                yield validate_entry(row)
+            except ValueError as error:
+                raise EntryError(line_no, error) from None
+    finally:
+        # 不关闭上传文件本身
+        text.detach()
+
+async def write_entries(db: AsyncSession, user_id, entries):
+    # 一批记录各用一条 executemany 的 upsert 写入
+    records = [
+        {'user_id': user_id, 'record_date': record_date, 'choice': choice}
+        for record_date, choice, food in entries if choice is not None
+    ]
+    foods = [
+        {'user_id': user_id, 'record_date': record_date, **food}
+        for record_date, choice, food in entries if food is not None
+    ]
+    if records:
+        stmt = insert(Record)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=['user_id', 'record_date'], set_={'choice': stmt.excluded.choice}
+        ), records)
+    if foods:
+        stmt = insert(FoodRecord)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=['user_id', 'record_date'],
+            set_={name: getattr(stmt.excluded, name) for name in MEALS + ('total_calories',)}
+        ), foods)
+    return len(entries)
+
+async def _rows(result):
+    # 按 yield_per 分批取出再逐行返回，避免每一行都切换一次数据库线程
+    async for partition in result.partitions():
+        for row in partition:
+            yield row
+
+async def _next(rows):
+    try:
+        return await rows.__anext__()
+    except StopAsyncIteration:
+        return None
+
+def _day_row(record_date, record, food):
+    row = {'date': record_date.isoformat(), 'choice': record.choice if record else None}
+    for name in MEALS + ('total_calories',):
+        row[name] = getattr(food, name) if food else None
+    return row
+
+async def iter_day_rows(db: AsyncSession, user_id):
+    records = _rows(await db.stream(select(Record.record_date, Record.choice).where(
+        Record.user_id == user_id
+    ).order_by(Record.record_date).execution_options(yield_per=BATCH_SIZE)))
+    foods = _rows(await db.stream(select(
+        FoodRecord.record_date, FoodRecord.breakfast, FoodRecord.lunch,
+        FoodRecord.dinner, FoodRecord.snack, FoodRecord.total_calories
+    ).where(FoodRecord.user_id == user_id).order_by(FoodRecord.record_date).execution_options(yield_per=BATCH_SIZE)))
+
+    record, food = await _next(records), await _next(foods)
+    while record is not None or food is not None:
+        if food is None or (record is not None and record.record_date < food.record_date):
+            yield _day_row(record.record_date, record, None)
+            record = await _next(records)
+        elif record is None or food.record_date < record.record_date:
+            yield _day_row(food.record_date, None, food)
+            food = await _next(foods)
+        else:
+            yield _day_row(record.record_date, record, food)
+            record, food = await _next(records), await _next(foods)
+
+async def export_chunks(user_id, fmt):
+    # StreamingResponse 发送时请求的依赖已经结束，这里自己打开会话；每 BATCH_SIZE 行输出一次
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, FIELDS, lineterminator='\n') if fmt == 'csv' else None
+    if writer:
+        writer.writeheader()
+    count = 0
+    async with SessionLocal() as db:
+        async for row in iter_day_rows(db, user_id):
+            if writer:
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(row, ensure_ascii=False) + '\n')
+            count += 1
+            if count % BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,85 @@
+"""按用户名查找用户
+
+读接口通过 get_user / find_user 依赖拿到用户信息，结果缓存在 user_cache 中，命中时不查询数据库。
+缓存的是只读的 UserInfo，需要修改用户时请自行查询 User 对象。
+多 worker 部署时（CACHE_VERIFY_VERSION=1）命中后还会按主键查一次 user_stats.version，
+与缓存时的版本不同说明其他 worker 写入过该用户的数据，此时重新加载用户。
+页面缓存可能比用户信息保存得更久（用户缓存被淘汰或 USER_CACHE_SIZE=0），所以每个用户最近看到的版本另外记录在
+seen_versions 中，每次加载时都与它比较，不同时清除本进程中该用户的页面缓存。
+另外在内存中保存全部用户名（启动时加载，创建用户时加入），供注册页面实时检查用户名是否可用。
+"""
+from collections import namedtuple
+
+from fastapi import Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import User, UserStats
+from database import get_db
+from cache import page_cache, user_cache, VERIFY_VERSION
+
+# 用户不会被删除，集合只增不减
+known_usernames = set()
+# 用户名 -> 最近一次加载时的 user_stats.version，只在 CACHE_VERIFY_VERSION=1 时使用
+seen_versions = {}
+
+async def load_usernames(db: AsyncSession):
+    known_usernames.clear()
+    known_usernames.update((await db.scalars(select(User.username))).all())
+    return len(known_usernames)
+
+def remember_username(username):
+    known_usernames.add(username)
+
+async def username_exists(db: AsyncSession, username):
+    # 多 worker 部署时其他 worker 注册的用户名不在本进程的集合中，集合里没有时再查一次数据库
+    if username in known_usernames:
+        return True
+    if VERIFY_VERSION and await db.scalar(select(User.id).where(User.username == username)) is not None:
+        remember_username(username)
+        return True
+    return False
+
+def calculate_bmr(gender, weight, height, age):
+    # 修订版 Harris-Benedict 公式
+    if gender == 'male':
+        return 13.397 * weight + 4.799 * height - 5.677 * age + 88.362
+    return 9.247 * weight + 3.098 * height - 4.330 * age + 447.593
+
+UserInfo = namedtuple('UserInfo', ['id', 'username', 'weight', 'height', 'age', 'gender', 'bmr', 'version'])
+
+def user_info(user, version=0):
+    return UserInfo(*(getattr(user, field) for field in UserInfo._fields[:-1]), version or 0)
+
+async def lookup_user(db: AsyncSession, username):
+    # 不存在的用户不缓存，注册后可以立即查到
+    key = ('user', username)
+    info = user_cache.get(key)
+    if info is not None:
+        if not VERIFY_VERSION:
+            return info
+        version = await db.scalar(select(UserStats.version).where(UserStats.user_id == info.id))
+        if (version or 0) == info.version:
+            return info
+        user_cache.invalidate(username)
+    generation = user_cache.generation(username)
+    row = (await db.execute(
+        select(User, UserStats.version).outerjoin(UserStats, UserStats.user_id == User.id).where(User.username == username)
+    )).first()
+    if row is None:
+        return None
+    info = user_info(*row)
+    if VERIFY_VERSION:
+        if seen_versions.get(username, info.version) != info.version:
+            page_cache.invalidate(username)
+        seen_versions[username] = info.version
+    user_cache.set(key, info, generation)
+    return info
+
+async def find_user(username: str, db: AsyncSession = Depends(get_db)):
+    return await lookup_user(db, username)
+
+async def get_user(user: UserInfo = Depends(find_user)):
+    if user is None:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    return user
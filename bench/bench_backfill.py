@@ -0,0 +1,70 @@
+"""批量补录接口基准测试
+
+在进程内启动应用（httpx.ASGITransport，不经过网络），对比补录 N 天数据的两种方式：
+    per_day  每天一个请求（POST /api/u/{username}/records 只带一条），N 次请求、N 次提交、N 次重建汇总
+    batch    一个请求带全部 N 条，一次提交、一次重建汇总
+每种方式使用一个新用户，已有 --history 天的历史记录。
+
+用法（在仓库根目录运行，需要 httpx）:
+    python bench/bench_backfill.py --days 30 365 --history 1000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+def make_entries(start, days, rnd):
+    return [{
+        'date': (start + timedelta(days=i)).isoformat(),
+        'choice': rnd.choice(('eat_much', 'not_eat_much')),
+        'breakfast': rnd.randint(0, 600), 'lunch': rnd.randint(0, 900),
+        'dinner': rnd.randint(0, 900), 'snack': rnd.randint(0, 300)
+    } for i in range(days)]
+
+async def run(args):
+    import httpx
+    import main
+
+    rnd = random.Random(0)
+    today = date.today()
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+            print(f"{'days':>6} {'impl':<8} {'seconds':>8} {'requests':>9}")
+            for days in args.days:
+                history = make_entries(today - timedelta(days=args.history + days), args.history, rnd)
+                entries = make_entries(today - timedelta(days=days - 1), days, rnd)
+                for name in ('per_day', 'batch'):
+                    username = f'{name}{days}'
+                    await client.post(f'/u/{username}/setting', data={'weight': 60, 'height': 165, 'age': 30, 'gender': 'female'})
+                    for i in range(0, len(history), 1000):
+                        await client.post(f'/api/u/{username}/records', json=history[i:i + 1000])
+
+                    batches = [[entry] for entry in entries] if name == 'per_day' else [entries]
+                    start = time.perf_counter()
+                    for batch in batches:
+                        response = await client.post(f'/api/u/{username}/records', json=batch)
+                        assert response.status_code == 200, response.text
+                    elapsed = time.perf_counter() - start
+                    print(f'{days:>6} {name:<8} {elapsed:>8.3f} {len(batches):>9}')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, nargs='+', default=[30, 365])
+    parser.add_argument('--history', type=int, default=1000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'data'))
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+    asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""/check_user 基准测试
+
+在进程内启动应用（httpx.ASGITransport，不经过网络），对比两种实现每秒能处理的请求数：
+    orm_query  旧实现：每次请求从数据库加载完整的 User 对象
+    memory     当前实现：查内存中的用户名集合
+查询的用户名一半存在、一半不存在。测试时关闭限流，最后单独演示一个客户端连续请求时被限流的情况。
+
+用法（在仓库根目录运行，需要 httpx）:
+    python bench/bench_check_user.py --users 10000 --clients 20 --duration 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+async def measure(client, path, usernames, clients, duration):
+    count = 0
+
+    async def client_loop(deadline):
+        nonlocal count
+        rnd = random.Random()
+        while time.perf_counter() < deadline:
+            response = await client.get(path, params={'username': rnd.choice(usernames)})
+            assert response.status_code == 200, response.text
+            count += 1
+
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(client_loop(deadline) for _ in range(clients)))
+    return count / duration
+
+async def run(args):
+    import httpx
+    from fastapi import Depends
+    from sqlalchemy import select
+    import main, models
+    from database import SessionLocal, get_db
+
+    @main.app.get('/bench/check_user_orm')
+    async def check_user_orm(username: str, db=Depends(get_db)):
+        user = await db.scalar(select(models.User).where(models.User.username == username))
+        return {'exists': user is not None}
+
+    existing = [f'user{i}' for i in range(args.users)]
+    usernames = existing + [f'missing{i}' for i in range(args.users)]
+
+    async with main.lifespan(main.app):
+        async with SessionLocal() as db:
+            await db.execute(models.User.__table__.insert(), [{'username': name} for name in existing])
+            await db.commit()
+        async with SessionLocal() as db:
+            await main.load_usernames(db)
+
+        transport = httpx.ASGITransport(app=main.app, client=('127.0.0.1', 12345))
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            print(f"{'impl':<10} {'req/s':>10}")
+            for name, path in (('orm_query', '/bench/check_user_orm'), ('memory', '/check_user')):
+                rate = await measure(client, path, usernames, args.clients, args.duration)
+                print(f'{name:<10} {rate:>10.0f}')
+
+            # 打开限流后，同一个客户端连续请求 100 次
+            limiter = main.check_user_limiter
+            limiter.rate, limiter.burst = args.rate, args.burst
+            codes = [(await client.get('/check_user', params={'username': 'user1'})).status_code for _ in range(100)]
+            print(f'限流 {args.rate}/s（突发 {args.burst}）：连续 100 次请求中 {codes.count(200)} 次成功，'
+                  f'{codes.count(429)} 次返回 429')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--rate', type=float, default=5)
+    parser.add_argument('--burst', type=int, default=10)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'data'))
+    os.chdir(workdir)
+    os.environ['CHECK_USER_RATE'] = '0'
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+    asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""事件流（SSE）的连接数和推送延迟测试
+
+启动一个 uvicorn 进程（或用 --url 连接正在运行的服务），对同一批用户打开 --connections 个 /u/{username}/events 连接，
+然后逐个用户提交打卡，统计从提交到该用户的所有连接收到事件的延迟；本地启动时同时输出服务进程每个连接增加的内存。
+最后向服务发送 SIGTERM，检查打开着的连接会被结束、服务在 --shutdown-timeout 秒内退出。
+
+用法（在仓库根目录运行，需要 httpx 和 uvicorn；连接数较多时先调高 ulimit -n）:
+    python bench/bench_events.py --connections 2000 --users 100
+    python bench/bench_events.py --url http://127.0.0.1:8000 --connections 500 --users 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from load_test import percentile
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+def rss_kb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return None
+
+class Listener:
+    # 一个原始的 SSE 连接：只解析 event: 行，记录收到每种事件的时间
+    def __init__(self, host, port, username):
+        self.host, self.port, self.username = host, port, username
+        self.received = asyncio.Event()
+        self.closed = asyncio.Event()
+        self.received_at = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(f'GET /u/{self.username}/events HTTP/1.1\r\nHost: {self.host}\r\n'
+                          f'Accept: text/event-stream\r\n\r\n'.encode())
+        status = await self.reader.readline()
+        if b' 200 ' not in status:
+            raise RuntimeError(f'{self.username}: {status!r}')
+        while await self.reader.readline() not in (b'\r\n', b''):
+            pass
+
+    async def listen(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                if b'event: record' in line and self.received_at is None:
+                    self.received_at = time.perf_counter()
+                    self.received.set()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.closed.set()
+
+async def run(args, host, port, pid):
+    usernames = [f'{args.prefix}{i}' for i in range(args.users)]
+    async with httpx.AsyncClient(base_url=f'http://{host}:{port}', timeout=30) as client:
+        for username in usernames:
+            response = await client.post(f'/u/{username}/setting', data={
+                'weight': 70, 'height': 170, 'age': 30, 'gender': 'male'
+            })
+            response.raise_for_status()
+
+        before = rss_kb(pid) if pid else None
+        listeners = [Listener(host, port, usernames[i % len(usernames)]) for i in range(args.connections)]
+        start = time.perf_counter()
+        for i in range(0, len(listeners), 200):
+            await asyncio.gather(*(listener.connect() for listener in listeners[i:i + 200]))
+        connect_seconds = time.perf_counter() - start
+        tasks = [asyncio.create_task(listener.listen()) for listener in listeners]
+        await asyncio.sleep(1)
+        after = rss_kb(pid) if pid else None
+
+        by_user = {}
+        for listener in listeners:
+            by_user.setdefault(listener.username, []).append(listener)
+        latencies, fanout = [], []
+        for username, group in by_user.items():
+            start = time.perf_counter()
+            response = await client.post('/submit', json={'username': username, 'choice': 'not_eat_much'})
+            response.raise_for_status()
+            await asyncio.wait_for(asyncio.gather(*(listener.received.wait() for listener in group)), 10)
+            latencies.extend(listener.received_at - start for listener in group)
+            fanout.append(max(listener.received_at for listener in group) - start)
+
+        result = {
+            'connections': len(listeners),
+            'users': len(by_user),
+            'connect_seconds': round(connect_seconds, 2),
+            'rss_kb_per_connection': round((after - before) / len(listeners), 1) if pid else None,
+            'event_p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'event_p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'fanout_max_ms': round(max(fanout) * 1000, 2),
+        }
+        metrics = await client.get('/metrics')
+        if metrics.status_code == 200:
+            result['metrics'] = {line.split()[0]: float(line.split()[1])
+                                 for line in metrics.text.splitlines() if line.startswith('sse_')}
+    return listeners, tasks, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--prefix', default='events')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--shutdown-timeout', type=float, default=10)
+    parser.add_argument('--url', help='测试正在运行的服务，而不是启动 uvicorn（不测量内存和关闭）')
+    args = parser.parse_args()
+
+    process = None
+    if args.url:
+        host, port = httpx.URL(args.url).host, httpx.URL(args.url).port or 80
+    else:
+        host, port = '127.0.0.1', args.port
+        workdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(workdir, 'data'))
+        env = dict(os.environ, PYTHONPATH=os.path.abspath(APP_DIR), CHECK_USER_RATE='0')
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning'],
+            cwd=workdir, env=env
+        )
+        for _ in range(100):
+            try:
+                httpx.get(f'http://{host}:{port}/metrics')
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+
+    async def session():
+        listeners, tasks, result = await run(args, host, port, process.pid if process else None)
+        if process:
+            # 连接全部打开时发送 SIGTERM：事件流应该结束，uvicorn 随后执行 lifespan 关闭并退出
+            start = time.perf_counter()
+            process.send_signal(signal.SIGTERM)
+            await asyncio.wait_for(asyncio.gather(*(listener.closed.wait() for listener in listeners)), args.shutdown_timeout)
+            result['streams_closed_seconds'] = round(time.perf_counter() - start, 2)
+            code = await asyncio.get_running_loop().run_in_executor(None, process.wait, args.shutdown_timeout)
+            result['shutdown_seconds'] = round(time.perf_counter() - start, 2)
+            result['exit_code'] = code
+        for task in tasks:
+            task.cancel()
+        for listener in listeners:
+            listener.writer.close()
+        return result
+
+    try:
+        result = asyncio.run(session())
+    finally:
+        if process and process.poll() is None:
+            process.kill()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""指标采集开销测试
+
+分别在 METRICS_ENABLED=1 和 0 下启动应用（各自一个子进程，httpx.ASGITransport，不经过网络），
+对同一组用户的主页、统计、历史、图表页面和图表接口发起固定次数的请求，比较每秒请求数。
+--page-cache 0 时关闭页面缓存，每次请求都查询数据库并渲染模板。两种配置交替运行 --rounds 轮，取最好成绩。
+
+用法（在仓库根目录运行，需要 httpx）:
+    python bench/bench_metrics.py --requests 3000 --rounds 3
+    python bench/bench_metrics.py --page-cache 0
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+PATHS = ('/u/{}', '/u/{}/statistics', '/u/{}/history', '/u/{}/charts', '/api/u/{}/charts')
+
+async def run(args):
+    import httpx
+    import main
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            usernames = [f'user{i}' for i in range(args.users)]
+            for username in usernames:
+                await client.post(f'/u/{username}/setting', data={'weight': 70, 'height': 170, 'age': 30, 'gender': 'male'})
+                await client.post('/submit', json={'username': username, 'choice': 'not_eat_much'})
+                await client.post(f'/u/{username}/detail', data={'breakfast': 300, 'lunch': 600, 'dinner': 500, 'snack': 40})
+            paths = [path.format(username) for username in usernames for path in PATHS]
+            for path in paths:
+                await client.get(path)
+
+            start = time.perf_counter()
+            for i in range(args.requests):
+                response = await client.get(paths[i % len(paths)])
+                assert response.status_code == 200, response.status_code
+            print(args.requests / (time.perf_counter() - start))
+
+def child(args):
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'data'))
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+    asyncio.run(run(args))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--page-cache', default='1024')
+    parser.add_argument('--child', action='store_true')
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    best = {'1': 0, '0': 0}
+    for _ in range(args.rounds):
+        for enabled in best:
+            env = dict(os.environ, METRICS_ENABLED=enabled, PAGE_CACHE_SIZE=args.page_cache)
+            output = subprocess.run(
+                [sys.executable, __file__, '--child', '--requests', str(args.requests), '--users', str(args.users)],
+                env=env, capture_output=True, text=True, check=True
+            ).stdout
+            best[enabled] = max(best[enabled], float(output.split()[-1]))
+    print(f"{'metrics':<8} {'req/s':>9}")
+    print(f"{'off':<8} {best['0']:>9.0f}")
+    print(f"{'on':<8} {best['1']:>9.0f}")
+    print(f"开销 {(1 - best['1'] / best['0']) * 100:.1f}%")
+
+if __name__ == '__main__':
+    main()
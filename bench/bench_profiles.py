@@ -0,0 +1,102 @@
+"""SQLite 存储配置基准测试
+
+对每个 DB_PROFILE 分别启动一个进程内的应用实例（httpx.ASGITransport，不经过网络），
+用固定数量的并发客户端混合读写：读请求访问用户主页和统计页，写请求提交当天的饮食记录。
+输出每个配置下读、写的吞吐量和 p50 / p99 延迟。
+
+用法（在仓库根目录运行，需要 httpx）:
+    python bench/bench_profiles.py --clients 50 --duration 10 --write-ratio 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0
+
+async def run_profile(args):
+    import httpx
+    import main
+
+    users = [f'bench{i}' for i in range(args.users)]
+    latencies = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+
+    async def client_loop(client, deadline):
+        rnd = random.Random()
+        while time.perf_counter() < deadline:
+            username = rnd.choice(users)
+            if rnd.random() < args.write_ratio:
+                kind = 'write'
+                request = client.post(f'/u/{username}/detail', data={
+                    'breakfast': rnd.choice([0, 200, 400]), 'lunch': 500, 'dinner': 500, 'snack': 0
+                })
+            else:
+                kind = 'read'
+                request = client.get(rnd.choice(['/u/{}', '/u/{}/statistics']).format(username))
+            start = time.perf_counter()
+            response = await request
+            latencies[kind].append(time.perf_counter() - start)
+            if response.status_code >= 500:
+                errors[kind] += 1
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            for username in users:
+                await client.post('/register', data={'username': username})
+                await client.post(f'/u/{username}/setting', data={'weight': 70, 'height': 170, 'age': 30, 'gender': 'male'})
+                await client.post('/submit', json={'username': username, 'choice': 'not_eat_much'})
+            deadline = time.perf_counter() + args.duration
+            await asyncio.gather(*(client_loop(client, deadline) for _ in range(args.clients)))
+
+    return {
+        kind: {
+            'ops_per_sec': round(len(values) / args.duration, 1),
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+            'errors': errors[kind],
+        }
+        for kind, values in latencies.items()
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profiles', nargs='+', default=['legacy', 'wal', 'durable'])
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # 子进程：在临时目录中用当前环境变量指定的配置运行一次
+        sys.path.insert(0, os.path.abspath(APP_DIR))
+        print(json.dumps(asyncio.run(run_profile(args))))
+        return
+
+    print(f"{'profile':<10} {'kind':<6} {'ops/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for profile in args.profiles:
+        workdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(workdir, 'data'))
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child'] + sys.argv[1:],
+            cwd=workdir, env=dict(os.environ, DB_PROFILE=profile),
+            check=True, capture_output=True, text=True
+        ).stdout
+        for kind, result in json.loads(output.splitlines()[-1]).items():
+            print(f"{profile:<10} {kind:<6} {result['ops_per_sec']:>8} {result['p50_ms']:>9} "
+                  f"{result['p99_ms']:>9} {result['errors']:>7}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""全部路由的基准测试
+
+依次对每个路由施加固定并发的负载，输出吞吐量、p50 / p95 / p99 延迟和每个请求的 SQL 条数（JSON），
+保存下来可以与其他提交的结果对比。SQL 条数和数据库耗时取自测试前后两次 /metrics 的差值，服务关闭指标时为 null。
+
+默认在进程内启动应用（httpx.ASGITransport，不经过网络），用 app/seed.py 生成 --users 个用户、每人 --days 天的数据；
+也可以用 --url 测试一个正在运行、已经用 `python admin.py seed` 填充过数据的服务（--prefix 与生成时一致）。
+用户按固定的随机种子选取，/submit 每个用户只提交一次（数据截止到昨天）。
+
+用法（在仓库根目录运行，需要 httpx）:
+    python bench/bench_routes.py --users 200 --days 1825 --output before.json
+    python bench/bench_routes.py --users 200 --days 1825 --output after.json
+    python bench/bench_routes.py --compare before.json after.json
+    python bench/bench_routes.py --url http://127.0.0.1:8000 --prefix seed --output server.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+from load_test import percentile
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+# (方法 路径, 生成请求参数的函数)；方法和路径同时是 /metrics 中的 method 和 route 标签
+ROUTES = [
+    ('GET /u/{username}', None),
+    ('GET /u/{username}/statistics', None),
+    ('GET /u/{username}/charts', None),
+    ('GET /api/u/{username}/charts', None),
+    ('GET /api/u/{username}/trends', lambda rnd: {'params': {
+        'period': rnd.choice(['week', 'month']), 'days': rnd.choice([365, 1825])
+    }}),
+    ('GET /u/{username}/history', None),
+    ('GET /u/{username}/detail', None),
+    ('POST /u/{username}/detail', lambda rnd: {'data': {
+        'breakfast': rnd.randint(0, 500), 'lunch': rnd.randint(300, 900),
+        'dinner': rnd.randint(300, 900), 'snack': rnd.randint(0, 300)
+    }}),
+    ('POST /submit', None),
+]
+
+METRIC_LINE = re.compile(r'^(db_queries_per_request|db_time_per_request_seconds)_(sum|count)\{method="(\w+)",route="([^"]+)"\} (\S+)$')
+
+async def read_metrics(client):
+    # {(指标, method, route): [sum, count]}；服务没有 /metrics 时返回 None
+    try:
+        response = await client.get('/metrics')
+    except httpx.HTTPError:
+        return None
+    if response.status_code != 200:
+        return None
+    values = {}
+    for line in response.text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            name, field, method, route, value = match.groups()
+            values.setdefault((name, method, route), [0, 0])[field == 'count'] = float(value)
+    return values
+
+def per_request(before, after, name, method, route, scale=1):
+    if before is None or after is None:
+        return None
+    old = before.get((name, method, route), [0, 0])
+    new = after.get((name, method, route), [0, 0])
+    count = new[1] - old[1]
+    return round((new[0] - old[0]) / count * scale, 3) if count else None
+
+async def run_route(client, name, body, usernames, args):
+    method, path = name.split(' ', 1)
+    rnd = random.Random(args.seed)
+    latencies, errors = [], 0
+    # /submit 每个用户只能提交一次，按顺序分给各个客户端
+    pending = iter(rnd.sample(usernames, len(usernames))) if path == '/submit' else None
+
+    async def client_loop(deadline):
+        nonlocal errors
+        local = random.Random(rnd.random())
+        while time.perf_counter() < deadline:
+            if pending is not None:
+                username = next(pending, None)
+                if username is None:
+                    return
+                kwargs = {'json': {'username': username, 'choice': local.choice(['eat_much', 'not_eat_much'])}}
+            else:
+                username = local.choice(usernames)
+                kwargs = body(local) if body else {}
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path.format(username=username), **kwargs)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    before = await read_metrics(client)
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(start + args.duration) for _ in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    after = await read_metrics(client)
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        'queries_per_request': per_request(before, after, 'db_queries_per_request', method, path),
+        'db_ms_per_request': per_request(before, after, 'db_time_per_request_seconds', method, path, 1000),
+    }
+
+async def run_all(client, usernames, args):
+    results = {}
+    for name, body in ROUTES:
+        if args.routes and name not in args.routes:
+            continue
+        results[name] = await run_route(client, name, body, usernames, args)
+        print(f"{name:<32} {results[name]['throughput']:>9.1f} req/s  p95 {results[name]['p95_ms']} ms  "
+              f"SQL {results[name]['queries_per_request']}", file=sys.stderr)
+    return results
+
+async def run_local(args):
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'data'))
+    os.chdir(workdir)
+    os.environ.setdefault('CHECK_USER_RATE', '0')
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+    import main
+    from database import SessionLocal
+    from seed import seed, seeded_usernames
+
+    async with main.lifespan(main.app):
+        start = time.perf_counter()
+        async with SessionLocal() as db:
+            counts = await seed(db, args.users, args.days, args.prefix, args.seed)
+        print(f'生成 {counts[0]} 个用户，{counts[1]} 条打卡记录，{counts[2]} 条饮食记录，'
+              f'{time.perf_counter() - start:.1f} 秒', file=sys.stderr)
+        async with SessionLocal() as db:
+            usernames = await seeded_usernames(db, args.prefix)
+            await main.load_usernames(db)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=60) as client:
+            return await run_all(client, usernames, args)
+
+async def run_remote(args):
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        usernames = [f'{args.prefix}{i}' for i in range(args.users)]
+        return await run_all(client, usernames, args)
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old_path} ({old.get('commit')}) -> {new_path} ({new.get('commit')})")
+    print(f"{'route':<32} {'req/s':>17} {'p95 ms':>19} {'SQL':>11}")
+
+    def change(a, b):
+        return f'{(b / a - 1) * 100:+.0f}%' if a and b is not None else ''
+
+    for name in new['routes']:
+        a, b = old['routes'].get(name, {}), new['routes'][name]
+        print(f"{name:<32} {b['throughput']:>9.1f} {change(a.get('throughput'), b['throughput']):>7} "
+              f"{b['p95_ms'] or 0:>11.2f} {change(a.get('p95_ms'), b['p95_ms']):>7} "
+              f"{a.get('queries_per_request')} -> {b['queries_per_request']}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=10, help='每个路由的测试时间（秒）')
+    parser.add_argument('--prefix', default='seed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--routes', nargs='*', help='只测试指定的路由，如 "GET /u/{username}"')
+    parser.add_argument('--url', help='测试正在运行的服务，而不是在进程内启动应用')
+    parser.add_argument('--output', help='结果写入该文件（默认输出到标准输出）')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='对比两次结果')
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    commit = git_commit()
+    results = asyncio.run(run_remote(args) if args.url else run_local(args))
+    report = {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'config': {key: getattr(args, key) for key in ('users', 'days', 'clients', 'duration', 'seed', 'url')},
+        'env': {key: os.environ[key] for key in ('DB_PROFILE', 'PAGE_CACHE_SIZE', 'USER_CACHE_SIZE', 'JOB_CONCURRENCY') if key in os.environ},
+        'routes': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
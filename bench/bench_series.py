@@ -0,0 +1,218 @@
+"""图表时间序列基准测试
+
+对比两种方式生成图表数据的耗时，并检查结果是否完全一致：
+    loop    旧实现：逐天遍历，用日期字符串作为字典键
+    series  app/series.py 中基于 NumPy 的向量化实现
+
+用法（在仓库根目录运行）:
+    python bench/bench_series.py --days 30 365 1825 3650
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from series import MEALS, build_chart_series
+
+def timeit(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def legacy_chart_data(bmr, start_date, today, food_records, record_choices):
+    current_date = start_date
+    # 准备图表数据
+    dates = []
+    calories = []
+    calorie_deficit = []
+    eat_much = []
+    not_eat_much = []
+    streaks = []
+
+    # 初始化日期范围
+    date_to_calories = {}
+    date_to_choice = {}
+
+    # 填充食物记录数据
+    for record in food_records:
+        date_str = record.record_date.strftime('%Y-%m-%d')
+        date_to_calories[date_str] = record.total_calories
+        if bmr:
+            date_to_calories[f'{date_str}_deficit'] = bmr - record.total_calories
+
+    # 填充饮食选择数据
+    for record in record_choices:
+        date_str = record.record_date.strftime('%Y-%m-%d')
+        date_to_choice[date_str] = record.choice
+
+    # 计算连续打卡天数
+    consecutive_days = 0
+    prev_date = None
+
+    # 生成日期序列和对应数据
+    while current_date <= today:
+        date_str = current_date.strftime('%Y-%m-%d')
+        dates.append(date_str)
+
+        # 热量数据
+        calories.append(date_to_calories.get(date_str, 0))
+
+        # 热量缺口数据
+        deficit = date_to_calories.get(f'{date_str}_deficit', 0) if bmr else 0
+        calorie_deficit.append(deficit)
+
+        # 饮食选择数据
+        eat_much.append(1 if date_to_choice.get(date_str) == 'eat_much' else 0)
+        not_eat_much.append(1 if date_to_choice.get(date_str) == 'not_eat_much' else 0)
+
+        # 连续打卡天数
+        if date_str in date_to_choice:
+            if prev_date and (current_date - prev_date).days == 1:
+                consecutive_days += 1
+            else:
+                consecutive_days = 1
+            prev_date = current_date
+        else:
+            consecutive_days = 0
+        streaks.append(consecutive_days)
+
+        current_date += timedelta(days=1)
+
+    # 各餐热量占比
+    breakfast_total = sum(fr.breakfast for fr in food_records if fr.breakfast)
+    lunch_total = sum(fr.lunch for fr in food_records if fr.lunch)
+    dinner_total = sum(fr.dinner for fr in food_records if fr.dinner)
+    snack_total = sum(fr.snack for fr in food_records if fr.snack)
+    total = breakfast_total + lunch_total + dinner_total + snack_total
+
+    meals = {
+        'breakfast': breakfast_total,
+        'lunch': lunch_total,
+        'dinner': dinner_total,
+        'snack': snack_total
+    }
+
+    # 饮食规律热力图数据 (按星期)
+    weekday_patterns = {
+        'breakfast': [0, 0, 0, 0, 0, 0, 0],  # 周日到周六
+        'lunch': [0, 0, 0, 0, 0, 0, 0],
+        'dinner': [0, 0, 0, 0, 0, 0, 0],
+        'snack': [0, 0, 0, 0, 0, 0, 0],
+        'count': [0, 0, 0, 0, 0, 0, 0]
+    }
+
+    for record in food_records:
+        weekday = record.record_date.weekday()  # 0=周一, 6=周日
+        # 转换为周日=0, 周六=6
+        adjusted_weekday = (weekday + 1) % 7
+        weekday_patterns['count'][adjusted_weekday] += 1
+        weekday_patterns['breakfast'][adjusted_weekday] += record.breakfast or 0
+        weekday_patterns['lunch'][adjusted_weekday] += record.lunch or 0
+        weekday_patterns['dinner'][adjusted_weekday] += record.dinner or 0
+        weekday_patterns['snack'][adjusted_weekday] += record.snack or 0
+
+    # 计算平均值
+    eating_patterns = {
+        'breakfast': [],
+        'lunch': [],
+        'dinner': [],
+        'snack': []
+    }
+
+    for i in range(7):
+        count = weekday_patterns['count'][i] or 1
+        eating_patterns['breakfast'].append(round(weekday_patterns['breakfast'][i] / count, 1))
+        eating_patterns['lunch'].append(round(weekday_patterns['lunch'][i] / count, 1))
+        eating_patterns['dinner'].append(round(weekday_patterns['dinner'][i] / count, 1))
+        eating_patterns['snack'].append(round(weekday_patterns['snack'][i] / count, 1))
+
+    # 饮食习惯数据
+    eating_habits = {
+        'eat_much': eat_much,
+        'not_eat_much': not_eat_much
+    }
+
+    return {
+        'dates': dates,
+        'calories': calories,
+        'bmr': bmr,
+        'meals': meals,
+        'eating_habits': eating_habits,
+        'calorie_deficit': calorie_deficit,
+        'eating_patterns': eating_patterns,
+        'streaks': streaks
+    }
+
+def make_rows(rnd, start_date, today, with_none=False):
+    food_rows, record_rows = [], []
+    day = start_date - timedelta(days=rnd.randint(0, 3))
+    while day <= today:
+        if rnd.random() < 0.8:
+            meals = [rnd.choice([0, 100, 250, 300, 550]) for _ in MEALS]
+            if with_none:
+                meals = [None if rnd.random() < 0.2 else value for value in meals]
+            food_rows.append((day, *meals, sum(value or 0 for value in meals)))
+        if rnd.random() < 0.85:
+            record_rows.append((day, rnd.choice(['eat_much', 'not_eat_much'])))
+        day += timedelta(days=1)
+    # 与数据库查询一致，只包含 start_date 之后的记录
+    food_rows = [row for row in food_rows if row[0] >= start_date]
+    record_rows = [row for row in record_rows if row[0] >= start_date]
+    return food_rows, record_rows
+
+def as_objects(food_rows, record_rows):
+    food_records = [
+        SimpleNamespace(record_date=row[0], breakfast=row[1], lunch=row[2], dinner=row[3], snack=row[4], total_calories=row[5])
+        for row in food_rows
+    ]
+    record_choices = [SimpleNamespace(record_date=row[0], choice=row[1]) for row in record_rows]
+    return food_records, record_choices
+
+def check_parity(cases):
+    rnd = random.Random(0)
+    today = date.today()
+    for case in range(cases):
+        days = rnd.choice([0, 1, 7, 30, 90, 365, 1000])
+        bmr = rnd.choice([None, 0, 1500, 1671.672])
+        start_date = today - timedelta(days=days)
+        food_rows, record_rows = make_rows(rnd, start_date, today, with_none=bmr is None)
+        expected = legacy_chart_data(bmr, start_date, today, *as_objects(food_rows, record_rows))
+        actual = build_chart_series(start_date, today, bmr, food_rows, record_rows)
+        if actual != expected:
+            for key in expected:
+                if actual[key] != expected[key]:
+                    print(f'第 {case} 组数据不一致（days={days}, bmr={bmr}）: {key}')
+            return False
+    print(f'{cases} 组随机数据结果一致')
+    return True
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, nargs='+', default=[30, 365, 1825, 3650])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--cases', type=int, default=200)
+    args = parser.parse_args()
+
+    if not check_parity(args.cases):
+        sys.exit(1)
+
+    today = date.today()
+    print(f"{'days':>6} {'loop(ms)':>10} {'series(ms)':>11}")
+    for days in args.days:
+        start_date = today - timedelta(days=days)
+        food_rows, record_rows = make_rows(random.Random(days), start_date, today)
+        objects = as_objects(food_rows, record_rows)
+        loop = timeit(lambda: legacy_chart_data(1600, start_date, today, *objects), args.repeat)
+        series = timeit(lambda: build_chart_series(start_date, today, 1600, food_rows, record_rows), args.repeat)
+        print(f'{days:>6} {loop:>10.2f} {series:>11.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""统计聚合基准测试
+
+对比三种方式计算用户统计数据的耗时：
+    python_passes  旧实现：加载全部 FoodRecord 对象后在 Python 中多次遍历
+    sql_aggregate  一次 SUM(CASE ...) / COUNT(CASE ...) 分组查询（重建汇总表时使用）
+    request        当前 /u/{username} 与 /u/{username}/statistics 的完整请求耗时
+
+用法（在仓库根目录运行）:
+    python bench/bench_stats.py --rows 10000 50000 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import select
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+def timeit(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+async def atimeit(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+async def seed(db, models, rows):
+    rnd = random.Random(rows)
+    db.add(models.User(id=1, username='bench', weight=70, height=170, age=30, gender='male', bmr=1655.5))
+    today = date.today()
+    records, food_records = [], []
+    for i in range(rows):
+        day = today - timedelta(days=i)
+        meals = [rnd.choice([0, 200, 400, 600]) for _ in range(3)] + [rnd.choice([0, 20, 100])]
+        records.append({'user_id': 1, 'record_date': day, 'choice': rnd.choice(['eat_much', 'not_eat_much'])})
+        food_records.append({
+            'user_id': 1, 'record_date': day,
+            'breakfast': meals[0], 'lunch': meals[1], 'dinner': meals[2], 'snack': meals[3],
+            'total_calories': sum(meals)
+        })
+    await db.execute(models.Record.__table__.insert(), records)
+    await db.execute(models.FoodRecord.__table__.insert(), food_records)
+    await db.commit()
+
+async def python_passes(db, models, user):
+    food_records = (await db.scalars(select(models.FoodRecord).where(models.FoodRecord.user_id == user.id))).all()
+    breakfast_total = sum(fr.breakfast for fr in food_records if fr.breakfast > 0)
+    lunch_total = sum(fr.lunch for fr in food_records if fr.lunch > 0)
+    dinner_total = sum(fr.dinner for fr in food_records if fr.dinner > 0)
+    snack_total = sum(fr.snack for fr in food_records if fr.snack > 0)
+    breakfast_days = sum(1 for fr in food_records if fr.breakfast > 0)
+    lunch_days = sum(1 for fr in food_records if fr.lunch > 0)
+    dinner_days = sum(1 for fr in food_records if fr.dinner > 0)
+    snack_days = sum(1 for fr in food_records if fr.snack > 0)
+    qualified = sum(1 for fr in food_records if 0 < user.bmr - fr.total_calories <= 500)
+    db.expunge_all()
+    return breakfast_total, lunch_total, dinner_total, snack_total, breakfast_days, lunch_days, dinner_days, snack_days, qualified
+
+def run(rows, repeat):
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'data'))
+    os.chdir(workdir)
+    # 关闭页面缓存，测量的是每次都查询数据库和渲染模板的耗时
+    os.environ['PAGE_CACHE_SIZE'] = '0'
+    for name in ('main', 'database', 'models', 'stats', 'cache'):
+        sys.modules.pop(name, None)
+    import main, models, database, stats
+    from fastapi.testclient import TestClient
+
+    async def measure_queries():
+        async with database.SessionLocal() as db:
+            await seed(db, models, rows)
+        async with database.SessionLocal() as db:
+            user = await db.get(models.User, 1)
+            return {
+                'rows': rows,
+                'python_passes_ms': await atimeit(lambda: python_passes(db, models, user), repeat),
+                'sql_aggregate_ms': await atimeit(lambda: stats.compute_user_stats(db, [user.id]), repeat),
+            }
+
+    with TestClient(main.app) as client:
+        result = client.portal.call(measure_queries)
+        result['user_page_ms'] = timeit(lambda: client.get('/u/bench'), repeat)
+        result['statistics_page_ms'] = timeit(lambda: client.get('/u/bench/statistics'), repeat)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 50000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+    print(f"{'rows':>8} {'python_passes':>14} {'sql_aggregate':>14} {'/u/{user}':>10} {'/statistics':>12}  (ms)")
+    for rows in args.rows:
+        r = run(rows, args.repeat)
+        print(f"{r['rows']:>8} {r['python_passes_ms']:>14.1f} {r['sql_aggregate_ms']:>14.1f} "
+              f"{r['user_page_ms']:>10.1f} {r['statistics_page_ms']:>12.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""连续打卡天数基准测试
+
+对比三种方式计算一个用户的连续打卡数据的耗时，并检查后两种的结果是否一致：
+    sorts        旧实现：加载全部 Record 对象，主页和统计页各自排序、遍历
+    single_pass  当前实现 streaks.load_streaks：只取 (record_date, choice) 两列后一次遍历
+    window       gaps-and-islands 窗口查询，只返回每个连续段一行，再在 Python 中合并
+
+在 SQLite 上 window 需要三次临时 B 树排序，比直接取回两列再遍历更慢，所以没有采用。
+
+用法（在仓库根目录运行）:
+    python bench/bench_streaks.py --years 10 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import select, func, case
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+async def atimeit(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def make_records(rnd, user_id, days, skip_rate):
+    # 从今天往前 days 天，按 skip_rate 随机漏打卡，同一选择倾向连续出现
+    records = []
+    choice = 'eat_much'
+    for i in range(days):
+        if rnd.random() < skip_rate:
+            continue
+        if rnd.random() < 0.3:
+            choice = 'not_eat_much' if choice == 'eat_much' else 'eat_much'
+        records.append({'user_id': user_id, 'record_date': date.today() - timedelta(days=i), 'choice': choice})
+    return records
+
+async def legacy_sorts(db, models, user_id):
+    records = (await db.scalars(select(models.Record).where(
+        models.Record.user_id == user_id
+    ).order_by(models.Record.record_date.desc()))).all()
+
+    # 主页：连续打卡天数
+    consecutive_days = 0
+    if records:
+        sorted_records = sorted(records, key=lambda x: x.record_date, reverse=True)
+        prev_date = sorted_records[0].record_date
+        consecutive_days = 1
+        for record in sorted_records[1:]:
+            if (prev_date - record.record_date).days == 1:
+                consecutive_days += 1
+                prev_date = record.record_date
+            else:
+                break
+
+    # 统计页：最长连续记录和今天为止的连续打卡天数
+    max_streak = {'eat_much': 0, 'not_eat_much': 0}
+    current_eat_much = 0
+    current_not_eat_much = 0
+    for record in sorted(records, key=lambda x: x.record_date):
+        if record.choice == 'eat_much':
+            current_eat_much += 1
+            current_not_eat_much = 0
+            max_streak['eat_much'] = max(max_streak['eat_much'], current_eat_much)
+        else:
+            current_not_eat_much += 1
+            current_eat_much = 0
+            max_streak['not_eat_much'] = max(max_streak['not_eat_much'], current_not_eat_much)
+
+    current_streak_days = 0
+    if records:
+        sorted_dates = sorted(set(r.record_date for r in records), reverse=True)
+        if sorted_dates[0] == date.today():
+            current_streak_days += 1
+            for i in range(1, len(sorted_dates)):
+                if (sorted_dates[i-1] - sorted_dates[i]).days == 1:
+                    current_streak_days += 1
+                else:
+                    break
+    db.expunge_all()
+    return consecutive_days, current_streak_days, max_streak
+
+async def window_query(db, models, streaks, user_id):
+    # 日期相邻的记录 julianday - row_number 相同，按选择分区后同理
+    Record = models.Record
+    day = func.julianday(Record.record_date)
+    choice = case((Record.choice == 'eat_much', 'eat_much'), else_='not_eat_much')
+    islands = select(
+        Record.record_date,
+        choice.label('choice'),
+        (day - func.row_number().over(order_by=Record.record_date)).label('run'),
+        (day - func.row_number().over(partition_by=choice, order_by=Record.record_date)).label('choice_run')
+    ).where(Record.user_id == user_id).subquery()
+    last_date = func.max(islands.c.record_date)
+    query = select(
+        islands.c.run, islands.c.choice, func.count().label('days'), last_date.label('last_date')
+    ).group_by(islands.c.run, islands.c.choice, islands.c.choice_run).order_by(last_date)
+
+    # 同一选择的连续段一定落在同一个打卡连续段内
+    result = streaks.empty_streaks()
+    run_days = {}
+    row = None
+    for row in (await db.execute(query)).all():
+        run_days[row.run] = run_days.get(row.run, 0) + row.days
+        result[f'longest_{row.choice}'] = max(result[f'longest_{row.choice}'], row.days)
+    if row is not None:
+        result['last_date'] = row.last_date
+        result['current'] = run_days[row.run]
+        result[f'current_{row.choice}'] = row.days
+        result['longest'] = max(run_days.values())
+    return result
+
+async def run(years, repeat, parity_users):
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'data'))
+    os.chdir(workdir)
+    import database, models, streaks
+    from migrations import init_db
+
+    await init_db(database.engine)
+    rnd = random.Random(years)
+    async with database.SessionLocal() as db:
+        db.add(models.User(id=1, username='bench'))
+        await db.execute(models.Record.__table__.insert(), make_records(rnd, 1, years * 365, 0.02))
+        for user_id in range(2, parity_users + 2):
+            db.add(models.User(id=user_id, username=f'parity{user_id}'))
+            records = make_records(rnd, user_id, rnd.randint(1, 400), rnd.choice([0, 0.05, 0.3]))
+            await db.execute(models.Record.__table__.insert(), records)
+        await db.commit()
+
+    async with database.SessionLocal() as db:
+        for user_id in range(1, parity_users + 2):
+            actual = await streaks.load_streaks(db, user_id)
+            expected = await window_query(db, models, streaks, user_id)
+            if actual != expected:
+                print(f'用户 {user_id} 结果不一致:\n  single_pass {actual}\n  window      {expected}')
+                sys.exit(1)
+            # 旧实现中截止最近一次打卡的连续天数与新实现含义相同
+            if (await legacy_sorts(db, models, user_id))[0] != actual['current']:
+                print(f'用户 {user_id} 连续打卡天数与旧实现不一致')
+                sys.exit(1)
+
+        result = {
+            'years': years,
+            'sorts_ms': await atimeit(lambda: legacy_sorts(db, models, 1), repeat),
+            'single_pass_ms': await atimeit(lambda: streaks.load_streaks(db, 1), repeat),
+            'window_ms': await atimeit(lambda: window_query(db, models, streaks, 1), repeat),
+        }
+    await database.engine.dispose()
+    for name in ('database', 'models', 'streaks', 'migrations'):
+        sys.modules.pop(name, None)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, nargs='+', default=[10, 20])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--parity-users', type=int, default=50)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+    print(f"{'years':>6} {'sorts':>10} {'single_pass':>12} {'window':>10}  (ms)")
+    for years in args.years:
+        r = asyncio.run(run(years, args.repeat, args.parity_users))
+        print(f"{r['years']:>6} {r['sorts_ms']:>10.1f} {r['single_pass_ms']:>12.1f} {r['window_ms']:>10.1f}")
+
+if __name__ == '__main__':
+    main()
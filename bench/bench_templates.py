@@ -0,0 +1,138 @@
+"""模板渲染基准测试
+
+1. 编译：每个模板在新的 Environment 中首次加载的耗时，分别为从源码编译和从字节码缓存加载
+2. 渲染：历史记录和图表页面的完整请求，对比一次性渲染（TemplateResponse）和流式渲染（stream_cached），
+   记录首字节时间、总耗时和请求期间 Python 分配内存的峰值（tracemalloc）。
+   测试用户有 --years 年的打卡和饮食记录，关闭页面缓存，每次请求都重新渲染。
+
+用法（在仓库根目录运行）:
+    python bench/bench_templates.py --years 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+def bench_compile():
+    from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+    directory = os.path.join(APP_DIR, 'templates')
+    cache_dir = tempfile.mkdtemp()
+    FileSystemBytecodeCache(cache_dir)  # 空缓存
+    print(f"{'template':<16} {'source ms':>10} {'bytecode ms':>12}")
+    for name in sorted(os.listdir(directory)):
+        times = []
+        for bytecode_cache in (None, FileSystemBytecodeCache(cache_dir)):
+            # 第一轮从源码编译（同时写入字节码缓存），第二轮用新的 Environment 从缓存加载
+            env = Environment(loader=FileSystemLoader(directory), bytecode_cache=bytecode_cache)
+            if bytecode_cache is not None:
+                Environment(loader=FileSystemLoader(directory), bytecode_cache=bytecode_cache).get_template(name)
+                env = Environment(loader=FileSystemLoader(directory), bytecode_cache=bytecode_cache)
+            start = time.perf_counter()
+            env.get_template(name)
+            times.append((time.perf_counter() - start) * 1000)
+        print(f'{name:<16} {times[0]:>10.2f} {times[1]:>12.2f}')
+
+async def seed(db, models, days):
+    rnd = random.Random(days)
+    db.add(models.User(id=1, username='bench', weight=70, height=170, age=30, gender='male', bmr=1655.5))
+    today = date.today()
+    records, food_records = [], []
+    for i in range(days):
+        day = today - timedelta(days=i)
+        meals = [rnd.choice([0, 200, 400, 600]) for _ in range(3)] + [rnd.choice([0, 20, 100])]
+        records.append({'user_id': 1, 'record_date': day, 'choice': rnd.choice(['eat_much', 'not_eat_much'])})
+        food_records.append({
+            'user_id': 1, 'record_date': day,
+            'breakfast': meals[0], 'lunch': meals[1], 'dinner': meals[2], 'snack': meals[3],
+            'total_calories': sum(meals)
+        })
+    await db.execute(models.Record.__table__.insert(), records)
+    await db.execute(models.FoodRecord.__table__.insert(), food_records)
+    await db.commit()
+
+async def request(app, path):
+    # 直接调用 ASGI 应用，记录第一段响应体到达的时间
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'bench')], 'client': ('127.0.0.1', 12345), 'server': ('bench', 80)
+    }
+    start = time.perf_counter()
+    first = None
+    size = 0
+
+    received = False
+
+    async def receive():
+        # 请求体只有一段，之后一直等待（StreamingResponse 会在发送期间监听客户端断开）
+        nonlocal received
+        if received:
+            await asyncio.Event().wait()
+        received = True
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal first, size
+        if message['type'] == 'http.response.body' and message.get('body'):
+            if first is None:
+                first = time.perf_counter()
+            size += len(message['body'])
+
+    await app(scope, receive, send)
+    end = time.perf_counter()
+    return (first - start) * 1000, (end - start) * 1000, size
+
+async def bench_render(args):
+    import main, models
+    from database import SessionLocal
+
+    async with main.lifespan(main.app):
+        async with SessionLocal() as db:
+            await seed(db, models, args.years * 365)
+        async with SessionLocal() as db:
+            await main.backfill_user_stats(db)
+
+        stream_cached = main.stream_cached
+        print(f"\n{'page':<10} {'impl':<9} {'first ms':>9} {'total ms':>9} {'peak KB':>8} {'bytes':>8}")
+        for page in ('history', 'charts'):
+            for impl, render in (('buffered', main.render_cached), ('streamed', stream_cached)):
+                main.stream_cached = render
+                path = f'/u/bench/{page}'
+                await request(main.app, path)
+                results = []
+                for _ in range(args.repeat):
+                    tracemalloc.start()
+                    first, total, size = await request(main.app, path)
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    results.append((first, total, peak))
+                first = min(r[0] for r in results)
+                total = min(r[1] for r in results)
+                peak = min(r[2] for r in results)
+                print(f'{page:<10} {impl:<9} {first:>9.2f} {total:>9.2f} {peak / 1024:>8.0f} {size:>8}')
+        main.stream_cached = stream_cached
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    bench_compile()
+
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'data'))
+    os.chdir(workdir)
+    os.environ['PAGE_CACHE_SIZE'] = '0'
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+    asyncio.run(bench_render(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""导入导出基准测试
+
+在进程内启动应用（httpx.ASGITransport，不经过网络），生成 --rows 天的 CSV 上传到 /u/{username}/import，
+再分别以 CSV 和 JSONL 下载 /u/{username}/export 记录耗时，最后把导出的 JSONL 导入另一个用户，核对两次导出的内容一致。
+ASGITransport 会在客户端缓冲整个响应，因此导出的峰值内存（tracemalloc）直接对 transfer.export_chunks 测量，
+结果应当与行数无关，可以用不同的 --rows 对比。
+
+用法（在仓库根目录运行，需要 httpx）:
+    python bench/bench_transfer.py --rows 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+def make_csv(rows):
+    rnd = random.Random(0)
+    start = date.today() - timedelta(days=rows - 1)
+    lines = ['date,choice,breakfast,lunch,dinner,snack']
+    for i in range(rows):
+        choice = rnd.choice(('eat_much', 'not_eat_much', ''))
+        meals = [str(rnd.randint(0, 900)) if rnd.random() < 0.8 else '' for _ in range(4)]
+        if not choice and not any(meals):
+            choice = 'not_eat_much'
+        lines.append(','.join([(start + timedelta(days=i)).isoformat(), choice] + meals))
+    return ('\n'.join(lines) + '\n').encode()
+
+async def download(client, url):
+    start = time.perf_counter()
+    response = await client.get(url)
+    assert response.status_code == 200, response.status_code
+    return time.perf_counter() - start, len(response.content)
+
+async def export_peak(user_id, fmt):
+    from transfer import export_chunks
+    tracemalloc.start()
+    async for chunk in export_chunks(user_id, fmt):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+async def run(args):
+    import httpx
+    import main
+    from users import lookup_user
+    from database import SessionLocal
+
+    data = make_csv(args.rows)
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+            for name in ('alice', 'bob'):
+                await client.post(f'/u/{name}/setting', data={'weight': 60, 'height': 165, 'age': 30, 'gender': 'female'})
+
+            print(f'上传 {len(data) / 1e6:.1f} MB，{args.rows} 行')
+            start = time.perf_counter()
+            response = await client.post('/u/alice/import', files={'file': ('alice.csv', data)})
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 200, response.text
+            print(f"{'import csv':<12} {elapsed:>8.2f} s {args.rows / elapsed:>10.0f} 行/s")
+
+            async with SessionLocal() as db:
+                user_id = (await lookup_user(db, 'alice')).id
+            for fmt in ('csv', 'jsonl'):
+                elapsed, size = await download(client, f'/u/alice/export?format={fmt}')
+                peak = await export_peak(user_id, fmt)
+                print(f"{'export ' + fmt:<12} {elapsed:>8.2f} s {args.rows / elapsed:>10.0f} 行/s "
+                      f"{size / 1e6:>6.1f} MB  峰值内存 {peak / 1e6:.1f} MB")
+
+            exported = (await client.get('/u/alice/export?format=jsonl')).content
+            start = time.perf_counter()
+            response = await client.post('/u/bob/import', files={'file': ('bob.jsonl', exported)})
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 200, response.text
+            print(f"{'import jsonl':<12} {elapsed:>8.2f} s {args.rows / elapsed:>10.0f} 行/s")
+
+            same = (await client.get('/u/alice/export')).content == (await client.get('/u/bob/export')).content
+            print('往返一致' if same else '往返结果不一致')
+            if not same:
+                sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'data'))
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+    asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""多 worker 吞吐量测试
+
+依次用 1/2/4/8 个 worker 启动 gunicorn（gunicorn.conf.py），每次使用新的空数据库，
+再用 bench/load_test.py 施加同样的负载，汇总每种配置的吞吐量和 p50 / p99 延迟。
+压测客户端与服务运行在同一台机器上，也会占用 CPU，worker 数超过空闲核数后吞吐量不会再增加。
+
+用法（在仓库根目录运行，需要 gunicorn、uvicorn 和 httpx）:
+    python bench/bench_workers.py --workers 1 2 4 8 --clients 100 --duration 15
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BENCH_DIR, '..', 'app'))
+
+def wait_ready(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url + '/', timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError('服务没有启动')
+
+def run(workers, args):
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'data'))
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), BIND=f'127.0.0.1:{args.port}',
+               PYTHONPATH=APP_DIR, CHECK_USER_RATE='0')
+    server = subprocess.Popen(
+        ['gunicorn', '-c', os.path.join(APP_DIR, 'gunicorn.conf.py'), '--chdir', workdir, 'main:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f'http://127.0.0.1:{args.port}'
+    try:
+        wait_ready(url)
+        output = subprocess.run([
+            sys.executable, os.path.join(BENCH_DIR, 'load_test.py'), '--url', url,
+            '--clients', str(args.clients), '--duration', str(args.duration), '--users', str(args.users)
+        ], capture_output=True, text=True, check=True).stdout
+    finally:
+        server.terminate()
+        server.wait()
+    rate = float(re.search(r'([\d.]+) req/s', output).group(1))
+    total = re.search(r'^ALL\s+(\d+)\s+(\d+)\s+([\d.]+)\s+([\d.]+)', output, re.M)
+    return rate, int(total.group(2)), float(total.group(3)), float(total.group(4))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--port', type=int, default=8123)
+    args = parser.parse_args()
+
+    print(f'CPU 核数: {multiprocessing.cpu_count()}')
+    print(f"{'workers':>7} {'req/s':>9} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9}")
+    for workers in args.workers:
+        rate, errors, p50, p99 = run(workers, args)
+        print(f'{workers:>7} {rate:>9.1f} {errors:>7} {p50:>9.1f} {p99:>9.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""并发提交检查
+
+在进程内启动应用（httpx.ASGITransport），对同一个用户同时发出 --requests 个 POST /u/{username}/detail
+和 --requests 个 POST /submit，然后检查：
+    - food_records 和 records 中该用户当天各只有一行
+    - /submit 只有一个返回 200，其余都是 400（今日已记录）
+    - user_stats 与按原始记录重新计算的结果（compute_user_stats）相同，没有丢失的更新
+有任何一项不符合时以非零状态退出。
+
+用法（在仓库根目录运行，需要 httpx）:
+    python bench/check_concurrency.py
+    python bench/check_concurrency.py --requests 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+from collections import Counter
+
+import httpx
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+USERNAME = 'concurrent'
+
+async def run(args):
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'data'))
+    os.chdir(workdir)
+    os.environ.setdefault('CHECK_USER_RATE', '0')
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+    import main
+    from sqlalchemy import select, func
+    from database import SessionLocal
+    from models import User, Record, FoodRecord, UserStats
+    from stats import compute_user_stats, empty_user_stats
+
+    failures = []
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://check', timeout=60) as client:
+            response = await client.post(f'/u/{USERNAME}/setting', data={'weight': 70, 'height': 170, 'age': 30, 'gender': 'male'})
+            response.raise_for_status()
+
+            rnd = random.Random(args.seed)
+            detail = [client.post(f'/u/{USERNAME}/detail', data={
+                meal: rnd.randint(0, 800) for meal in ('breakfast', 'lunch', 'dinner', 'snack')
+            }) for _ in range(args.requests)]
+            submit = [client.post('/submit', json={
+                'username': USERNAME, 'choice': rnd.choice(['eat_much', 'not_eat_much'])
+            }) for _ in range(args.requests)]
+            responses = await asyncio.gather(*detail, *submit)
+
+        detail_status = Counter(response.status_code for response in responses[:args.requests])
+        submit_status = Counter(response.status_code for response in responses[args.requests:])
+        print(f'POST /u/{{username}}/detail: {dict(detail_status)}')
+        print(f'POST /submit: {dict(submit_status)}')
+        if detail_status != Counter({200: args.requests}):
+            failures.append('饮食记录的提交应该全部成功')
+        if submit_status != Counter({200: 1, 400: args.requests - 1}):
+            failures.append('打卡应该只有一个成功，其余返回 400')
+
+        # 后台任务（周、月汇总）执行完之后再读取
+        await main.job_queue.stop()
+        async with SessionLocal() as db:
+            user_id = await db.scalar(select(User.id).where(User.username == USERNAME))
+            for model in (FoodRecord, Record):
+                rows = await db.scalar(select(func.count()).select_from(model).where(model.user_id == user_id))
+                print(f'{model.__tablename__}: {rows} 行')
+                if rows != 1:
+                    failures.append(f'{model.__tablename__} 应该只有一行')
+
+            stored = await db.get(UserStats, user_id)
+            expected = (await compute_user_stats(db, [user_id])).get(user_id) or empty_user_stats(user_id)
+            for column in UserStats.__table__.columns:
+                if column.name == 'version':
+                    continue
+                a, b = getattr(stored, column.name), getattr(expected, column.name)
+                if a != b:
+                    failures.append(f'user_stats.{column.name}: {a}，重新计算为 {b}')
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=300, help='每个接口同时发出的请求数')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    failures = asyncio.run(run(args))
+    for failure in failures:
+        print(f'[失败] {failure}')
+    print('通过' if not failures else f'{len(failures)} 项检查失败')
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""数据库可移植性检查
+
+分别在 SQLite 和 DATABASE_URL 指定的数据库（如 PostgreSQL）上启动应用：执行迁移，生成相同的测试数据，
+把各个页面、接口、提交和导入导出都请求一遍，然后逐个比较两边的状态码和响应内容。
+两边的结果应该完全相同，有不同的响应时以非零状态退出。PostgreSQL 上会新建一个临时数据库，检查完后删除。
+
+用法（在仓库根目录运行，需要 asyncpg；可以用 docker run -e POSTGRES_HOST_AUTH_METHOD=trust -p 5432:5432 postgres
+或 pg_ctl 启动一个本地实例）:
+    python bench/check_portability.py postgresql://postgres@127.0.0.1:5432/postgres
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from check_query_plans import exercise
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+SEED_USERS = 20
+SEED_DAYS = 400
+
+def requests_for(username):
+    return [
+        ('GET', f'/u/{username}', {}),
+        ('GET', f'/u/{username}/statistics', {}),
+        ('GET', f'/u/{username}/charts', {}),
+        ('GET', f'/u/{username}/history', {}),
+        ('GET', f'/u/{username}/detail', {}),
+        ('GET', f'/api/u/{username}/charts', {'params': {'days': 365}}),
+        ('GET', f'/api/u/{username}/trends', {'params': {'period': 'week', 'days': 365}}),
+        ('GET', f'/api/u/{username}/trends', {'params': {'period': 'month', 'days': 1825}}),
+        ('GET', f'/api/u/{username}/history', {'params': {'cursor': '2099-01-01'}}),
+        ('GET', f'/u/{username}/export', {'params': {'format': 'jsonl'}}),
+        ('POST', '/submit', {'json': {'username': username, 'choice': 'eat_much'}}),
+        ('POST', f'/u/{username}/detail', {'data': {'breakfast': 300, 'lunch': 600, 'dinner': 500, 'snack': 0}}),
+        ('GET', f'/u/{username}', {}),
+        ('GET', f'/api/u/{username}/trends', {'params': {'period': 'week', 'days': 90}}),
+    ]
+
+class Recorder:
+    # 代替 TestClient 传给 check_query_plans.exercise，记录每个响应
+    def __init__(self, client):
+        self.client = client
+        self.responses = []
+
+    def request(self, method, path, **kwargs):
+        response = self.client.request(method, path, **kwargs)
+        self.responses.append({'request': f'{method} {path} {json.dumps(kwargs, sort_keys=True, ensure_ascii=False)}',
+                               'status': response.status_code, 'body': response.text})
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+def collect(output):
+    # 子进程：按当前的 DATABASE_URL 启动应用，把每个响应写到 output
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'data'))
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+
+    import main as app_main
+    from database import SessionLocal
+    from seed import seed
+    from users import load_usernames
+    from fastapi.testclient import TestClient
+
+    async def prepare():
+        async with SessionLocal() as db:
+            await seed(db, SEED_USERS, SEED_DAYS)
+        async with SessionLocal() as db:
+            await load_usernames(db)
+
+    with TestClient(app_main.app) as client:
+        client.portal.call(prepare)
+        recorder = Recorder(client)
+        exercise(recorder)
+        for i in range(SEED_USERS):
+            for method, path, kwargs in requests_for(f'seed{i}'):
+                recorder.request(method, path, **kwargs)
+        recorder.post('/register', data={'username': 'after-seed'})
+        recorder.get('/u/after-seed/setting')
+
+    with open(output, 'w') as f:
+        json.dump(recorder.responses, f, ensure_ascii=False)
+
+def run_child(database_url, output):
+    env = dict(os.environ, DATABASE_URL=database_url, CHECK_USER_RATE='0', JOB_CONCURRENCY='0',
+               METRICS_ENABLED='0', PAGE_CACHE_SIZE='0')
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--collect', output], env=env, check=True)
+    with open(output) as f:
+        return json.load(f)
+
+async def admin(url, statement):
+    engine = create_async_engine(url, isolation_level='AUTOCOMMIT')
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text(statement))
+    finally:
+        await engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('url', nargs='?', help='PostgreSQL 连接地址，用于新建临时数据库')
+    parser.add_argument('--collect', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.collect:
+        return collect(args.collect)
+    if not args.url:
+        parser.error('需要 PostgreSQL 连接地址')
+
+    url = make_url(args.url).set(drivername='postgresql+asyncpg')
+    database = f'diet_check_{uuid.uuid4().hex[:8]}'
+    workdir = tempfile.mkdtemp()
+    asyncio.run(admin(url, f'CREATE DATABASE {database}'))
+    try:
+        expected = run_child('sqlite+aiosqlite:///./data/data.db', os.path.join(workdir, 'sqlite.json'))
+        actual = run_child(url.set(database=database).render_as_string(hide_password=False),
+                           os.path.join(workdir, 'other.json'))
+    finally:
+        asyncio.run(admin(url, f'DROP DATABASE IF EXISTS {database}'))
+
+    failures = 0
+    for a, b in zip(expected, actual):
+        if a != b:
+            failures += 1
+            print(f"[diff] {a['request'][:120]}: {a['status']} -> {b['status']}")
+            print(f"        sqlite: {a['body'][:200]!r}")
+            print(f"        other:  {b['body'][:200]!r}")
+    if len(expected) != len(actual):
+        failures += 1
+        print(f'响应数不同: {len(expected)} / {len(actual)}')
+    print(f'{len(expected)} 个响应，{failures} 个不同')
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
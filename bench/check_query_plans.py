@@ -0,0 +1,82 @@
+"""查询计划检查
+
+把应用的各个页面和提交接口都请求一遍，记录期间执行的所有 SQL，
+再对每条语句执行 EXPLAIN QUERY PLAN。只要有语句对 users / records / food_records
+做了全表扫描（SCAN）而不是走索引（SEARCH），就以非零状态退出。
+
+用法（在仓库根目录运行）:
+    python bench/check_query_plans.py
+"""
+import os
+import re
+import sys
+import tempfile
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+CHECKED_TABLES = ('users', 'records', 'food_records', 'user_rollups')
+
+def exercise(client):
+    client.post('/register', data={'username': 'plan'})
+    client.post('/u/plan/setting', data={'weight': 70, 'height': 170, 'age': 30, 'gender': 'male'})
+    client.post('/submit', json={'username': 'plan', 'choice': 'eat_much'})
+    client.post('/u/plan/detail', data={'breakfast': 300, 'lunch': 600, 'dinner': 500, 'snack': 100})
+    client.post('/u/plan/detail', data={'breakfast': 200, 'lunch': 600, 'dinner': 500, 'snack': 0})
+    client.get('/check_user', params={'username': 'plan'})
+    for path in ('', '/setting', '/statistics', '/charts', '/history', '/detail'):
+        client.get('/u/plan' + path)
+    client.get('/api/u/plan/history', params={'cursor': '2099-01-01'})
+    client.get('/api/u/plan/history', params={'cursor': '2000-01-01', 'order': 'oldest', 'choice': 'eat_much'})
+    client.get('/api/u/plan/charts', params={'days': 365})
+    client.get('/api/u/plan/trends', params={'period': 'month', 'days': 1825})
+    client.get('/u/plan/export')
+    client.post('/u/plan/import', files={'file': ('plan.csv', 'date,choice,lunch\n2024-01-01,eat_much,500\n')})
+    client.post('/api/u/plan/records', json=[{'date': '2024-01-02', 'choice': 'eat_much', 'lunch': 400}])
+
+async def explain(engine, statements):
+    plans = {}
+    async with engine.connect() as conn:
+        for statement, parameters in statements.items():
+            result = await conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+            plans[statement] = [row[-1] for row in result]
+    return plans
+
+def main():
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'data'))
+    os.chdir(workdir)
+    # EXPLAIN QUERY PLAN 是 SQLite 的语法，总是使用临时的 SQLite 数据库
+    os.environ.pop('DATABASE_URL', None)
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+
+    import main as app_main
+    from database import engine
+    from sqlalchemy import event
+    from fastapi.testclient import TestClient
+
+    statements = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            statements.setdefault(statement, parameters)
+
+    with TestClient(app_main.app) as client:
+        # 启动时的迁移和补齐不算在内，只检查请求中执行的语句
+        event.listen(engine.sync_engine, 'before_cursor_execute', record)
+        exercise(client)
+        event.remove(engine.sync_engine, 'before_cursor_execute', record)
+        plans = client.portal.call(explain, engine, statements)
+
+    scan = re.compile(r'\bSCAN (?:TABLE )?(%s)\b' % '|'.join(CHECKED_TABLES))
+    failures = 0
+    for statement, plan in plans.items():
+        bad = [line for line in plan if scan.search(line)]
+        status = 'SCAN' if bad else 'ok'
+        failures += bool(bad)
+        print(f'[{status}] {" ".join(statement.split())[:120]}')
+        for line in plan:
+            print(f'        {line}')
+    print(f'{len(statements)} 条语句，{failures} 条存在全表扫描')
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""并发负载测试
+
+对一个正在运行的服务发起固定并发的请求，统计每个路由的 p50 / p99 延迟和吞吐量。
+比较改动前后时，分别启动两个版本的服务，用相同参数各跑一次即可。
+
+用法（需要 httpx）:
+    cd app && uvicorn main:app --port 8000
+    python bench/load_test.py --url http://127.0.0.1:8000 --clients 200 --duration 30
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+
+ROUTES = ('/u/{username}', '/u/{username}/statistics', '/u/{username}/charts', '/u/{username}/history')
+
+async def prepare_users(client, count):
+    # 每个用户都填写个人信息并打卡，保证页面不会重定向到设置页
+    usernames = [f'load{i}' for i in range(count)]
+    for username in usernames:
+        await client.post('/register', data={'username': username})
+        await client.post(f'/u/{username}/setting', data={'weight': 70, 'height': 170, 'age': 30, 'gender': 'male'})
+        await client.post('/submit', json={'username': username, 'choice': 'not_eat_much'})
+        await client.post(f'/u/{username}/detail', data={'breakfast': 300, 'lunch': 600, 'dinner': 500, 'snack': 40})
+    return usernames
+
+async def worker(client, usernames, deadline, write_ratio, latencies, errors):
+    rnd = random.Random()
+    while time.perf_counter() < deadline:
+        username = rnd.choice(usernames)
+        if rnd.random() < write_ratio:
+            route = 'POST /u/{username}/detail'
+            request = client.post(f'/u/{username}/detail', data={'breakfast': rnd.choice([0, 200, 400]), 'lunch': 500, 'dinner': 500, 'snack': 0})
+        else:
+            route = rnd.choice(ROUTES)
+            request = client.get(route.format(username=username))
+        start = time.perf_counter()
+        try:
+            response = await request
+            ok = response.status_code < 500
+        except httpx.HTTPError:
+            ok = False
+        latencies.setdefault(route, []).append(time.perf_counter() - start)
+        if not ok:
+            errors[route] = errors.get(route, 0) + 1
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--write-ratio', type=float, default=0.05)
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        usernames = await prepare_users(client, args.users)
+        latencies, errors = {}, {}
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(*(
+            worker(client, usernames, deadline, args.write_ratio, latencies, errors)
+            for _ in range(args.clients)
+        ))
+
+    everything = [value for values in latencies.values() for value in values]
+    print(f'{args.clients} 个并发客户端，{args.duration:.0f} 秒，共 {len(everything)} 个请求，'
+          f'{len(everything) / args.duration:.1f} req/s')
+    print(f"{'route':<30} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for route, values in sorted(latencies.items()) + [('ALL', everything)]:
+        error_count = sum(errors.values()) if route == 'ALL' else errors.get(route, 0)
+        print(f'{route:<30} {len(values):>7} {error_count:>7} {percentile(values, 50) * 1000:>9.1f} '
+              f'{percentile(values, 99) * 1000:>9.1f} {statistics.mean(values) * 1000:>9.1f}')
+
+if __name__ == '__main__':
+    asyncio.run(main())